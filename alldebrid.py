@@ -17,6 +17,11 @@
 """
 
 import re
+import os
+import time
+import random
+import threading
+import sqlite3
 from six.moves import urllib_parse, urllib_error
 import json
 from resolveurl.lib import helpers
@@ -24,6 +29,7 @@ from resolveurl import common
 from resolveurl.common import i18n
 from resolveurl.resolver import ResolveUrl, ResolverError
 import xbmcgui
+import xbmcvfs
 
 logger = common.log_utils.Logger.get_logger(__name__)
 logger.disable()
@@ -34,16 +40,195 @@ USER_AGENT = '{0}/{1}'.format(AGENT, VERSION)
 FORMATS = common.VIDEO_FORMATS
 
 api_url = 'https://api.alldebrid.com/v4'
+# Debrid cache written by Asguard's debrid check, shared so resolving a source it already checked costs no request
+debrid_cache_db = 'special://profile/addon_data/plugin.video.asguard/debridcache.db'
+# same policy as CACHE_TTL['ad'] / MAX_UNCACHED_TTL in Asguard's debridcheck.py: negative
+# results start at the uncached TTL and double with every further miss
+debrid_cache_ttl = {'cached': 24 * 60 * 60, 'uncached': 60 * 60}
+debrid_cache_max_uncached_ttl = 7 * 24 * 60 * 60
+# magnet/status polling: first delay, growth factor and jitter (the ceiling is the interval argument)
+poll_start = 0.5
+poll_backoff = 1.5
+poll_jitter = 0.2
+# largest files of a multi-file transfer unlocked while the select dialog is open
+prefetch_count = 3
+unlock_cache_ttl = 60 * 60
+# transfers kept on the account for repeat plays, evicted by age then least recently used
+transfer_registry_file = os.path.join(common.profile_path, 'alldebrid_transfers.json')
+transfer_registry_size = 50
+transfer_registry_age = 7 * 24 * 60 * 60
+# how long registering a transfer waits for the evicted ones to be deleted
+transfer_delete_timeout = 10
+
+
+class HosterMatcher(object):
+    """
+    Matches urls against the AllDebrid hoster regexes.
+    Patterns are bucketed by the domain labels found in their host part, so
+    a url is only tested against the patterns for the labels in its own host
+    (plus the few patterns with no literal domain).
+    """
+    def __init__(self, hosters):
+        self.buckets = {}
+        self.fallback = []
+        for regexp in hosters:
+            if not hasattr(regexp, 'search'):
+                regexp = re.compile(regexp)
+            labels = self.__pattern_labels(regexp.pattern)
+            if not labels:
+                self.fallback.append(regexp)
+            for label in labels:
+                self.buckets.setdefault(label, []).append(regexp)
+
+    @staticmethod
+    def __pattern_labels(pattern):
+        """
+        Labels one of which is in the host of every url the pattern matches, or
+        an empty set when the pattern can not be read that way. A label is only
+        trusted when it starts at a label boundary, so '(?:turbo)?bit\\.net' is
+        not filed under 'bit', and every literal dot must follow such a label
+        unless it ends an optional group like '(?:[a-z0-9-]+\\.)?'.
+        """
+        for segment in re.split(r'\\?/', pattern.lower()):
+            if '\\.' not in segment:
+                # only the scheme may come before the host
+                if not re.match(r'^[a-z()?:|^]*$', segment):
+                    return set()
+                continue
+            labels = {}
+            for dot in re.finditer(r'\\\.', segment):
+                label = re.search(r'(?:^|\\\.|\(\?:|\(|\^|\||\\\.\)[?*])([a-z0-9][a-z0-9-]*)$', segment[:dot.start()])
+                if label:
+                    if label.group(1) != 'www':
+                        labels[label.start(1)] = label.group(1)
+                elif not re.match(r'\)[?*]', segment[dot.end():]):
+                    return set()
+            # alternatives holding a domain must each name a label, '(?:com|net)' needs none
+            for alternatives in HosterMatcher.__alternations(segment):
+                if any('\\.' in segment[start:end] for start, end in alternatives):
+                    if not all(any(start <= pos < end for pos in labels) for start, end in alternatives):
+                        return set()
+            return set(labels.values())
+        return set()
+
+    @staticmethod
+    def __alternations(segment):
+        """
+        (start, end) spans of the alternatives of every group in a regex
+        fragment that has more than one, the fragment itself counting as a group.
+        """
+        alternations = []
+        stack = [[0]]
+        i = 0
+        while i < len(segment):
+            c = segment[i]
+            if c == '\\':
+                i += 1
+            elif c == '[':
+                close = segment.find(']', i + 2)
+                i = close if close > 0 else len(segment)
+            elif c == '(':
+                stack.append([i + 1])
+            elif c == '|':
+                stack[-1].append(i + 1)
+            elif c == ')' and len(stack) > 1:
+                alternations.append(stack.pop() + [i + 1])
+            i += 1
+        alternations.append(stack[0] + [len(segment) + 1])
+        return [[(bounds[j], bounds[j + 1] - 1) for j in range(len(bounds) - 1)]
+                for bounds in alternations if len(bounds) > 2]
+
+    def match(self, url):
+        # urls without a scheme have no hostname unless they start with //
+        if not re.match(r'(?:[a-z][a-z0-9+.-]*:)?//', url, re.I):
+            url = '//' + url
+        host = urllib_parse.urlparse(url).hostname or ''
+        seen = set()
+        for label in host.lower().split('.'):
+            for regexp in self.buckets.get(label, []):
+                if id(regexp) not in seen:
+                    seen.add(id(regexp))
+                    if regexp.search(url):
+                        return True
+        return any(regexp.search(url) for regexp in self.fallback)
+
+
+class TransferRegistry(object):
+    """
+    Persistent map of magnet hash -> finished AllDebrid transfer.
+    Entries hold the transfer id, its file names and when it was created;
+    put() returns the transfer ids that were evicted so they can be deleted.
+    """
+    lock = threading.Lock()
+
+    def __init__(self, path=transfer_registry_file, max_entries=transfer_registry_size, max_age=transfer_registry_age):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    def get(self, _hash):
+        with self.lock:
+            transfers = self.__load()
+            entry = transfers.get(_hash.lower())
+            if entry is None or time.time() - entry['created'] > self.max_age:
+                return None
+            entry['used'] = time.time()
+            self.__save(transfers)
+            return entry
+
+    def put(self, _hash, transfer_id, files):
+        with self.lock:
+            transfers = self.__load()
+            now = time.time()
+            transfers[_hash.lower()] = {'id': transfer_id, 'files': files, 'created': now, 'used': now}
+            evicted = [key for key, entry in transfers.items() if now - entry['created'] > self.max_age]
+            by_use = sorted((key for key in transfers if key not in evicted), key=lambda key: transfers[key]['used'])
+            evicted.extend(by_use[:max(0, len(by_use) - self.max_entries)])
+            evicted_ids = [transfers.pop(key)['id'] for key in evicted]
+            self.__save(transfers)
+            return evicted_ids
+
+    def remove(self, _hash):
+        with self.lock:
+            transfers = self.__load()
+            if transfers.pop(_hash.lower(), None) is not None:
+                self.__save(transfers)
+
+    def __load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def __save(self, transfers):
+        # write a sibling file and swap it in, a crash or another Kodi process
+        # must never see a half written registry
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(transfers, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.log_debug('AllDebrid: could not save transfer registry: {0}'.format(e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
 
 class AllDebridResolver(ResolveUrl):
     name = 'AllDebrid'
     domains = ['*']
+    unlocked_links = {}
+    unlocked_lock = threading.Lock()
 
     def __init__(self):
         self.hosters = None
         self.hosts = None
+        self.host_names = None
         self.headers = {'User-Agent': USER_AGENT}
+        self.registry = TransferRegistry()
 
     def get_media_url(self, host, media_id, cached_only=False, return_all=False):
         try:
@@ -51,17 +236,31 @@ class AllDebridResolver(ResolveUrl):
                 r = re.search('''magnet:.+?urn:([a-zA-Z0-9]+):([a-zA-Z0-9]+)''', media_id, re.I)
                 if r:
                     _hash = r.group(2)
-                    if self.__check_cache(_hash):
-                        logger.log_debug('AllDebrid: BTIH {0} is readily available to stream'.format(_hash))
-                        transfer_id = self.__create_transfer(_hash)
-                    else:
-                        if self.get_setting('cached_only') == 'true' or cached_only:
+                    transfer_id, transfer_info = self.__get_registered_transfer(_hash)
+                    registered = bool(transfer_info)
+                    if not transfer_info:
+                        cached_only = self.get_setting('cached_only') == 'true' or cached_only
+                        # check before uploading, an uploaded magnet that is not cached starts a
+                        # real transfer; otherwise the upload response says whether it is ready
+                        if cached_only and not self.check_cache_many([_hash]).get(_hash.lower()):
+                            raise ResolverError('AllDebrid: {0}'.format(i18n('cached_torrents_only')))
+                        transfer = self.__create_transfer(_hash)
+                        transfer_id = transfer.get('id')
+                        if not transfer_id:
+                            raise ResolverError('AllDebrid: {0}'.format(i18n('no_stream')))
+                        if transfer.get('ready'):
+                            logger.log_debug('AllDebrid: BTIH {0} is readily available to stream'.format(_hash))
+                            if transfer.get('links'):
+                                transfer_info = transfer
+                        elif cached_only:
+                            self.__delete_transfer(transfer_id)
                             raise ResolverError('AllDebrid: {0}'.format(i18n('cached_torrents_only')))
                         else:
-                            transfer_id = self.__create_transfer(_hash)
-                            self.__initiate_transfer(transfer_id)
+                            transfer_info = self.__initiate_transfer(transfer_id)
 
-                    transfer_info = self.__list_transfer(transfer_id)
+                        if not transfer_info:
+                            transfer_info = self.__list_transfer(transfer_id)
+                        registered = self.__register_transfer(_hash, transfer_id, transfer_info)
                     if return_all:
                         sources = [{'name': link.get('filename').split('/')[-1], 'link': link.get('link')}
                                    for link in transfer_info.get('links')
@@ -73,17 +272,24 @@ class AllDebridResolver(ResolveUrl):
                                    if any(link.get('filename').lower().endswith(x) for x in FORMATS)]
                     # Prompt user to select a source if there are multiple options
                     if len(sources) > 1:
+                        prefetch = self.__prefetch_unlocks([source[1] for source in sorted(sources, key=lambda x: x[0] or 0, reverse=True)[:prefetch_count]])
                         source_labels = [f"{source[2]} {source[1]}" for source in sources]
                         dialog = xbmcgui.Dialog()
                         selected_index = dialog.select("Select Source", source_labels)
                         if selected_index == -1:
                             raise ResolverError('AllDebrid: No source selected')
                         media_id = sources[selected_index][1]
+                        if media_id in prefetch:
+                            prefetch[media_id].join()
                     else:
                         media_id = sources[0][1]
-                        
-                        self.__delete_transfer(transfer_id)
+                        if not registered:
+                            self.__delete_transfer(transfer_id)
 
+            stream_url = self.__get_unlocked(media_id)
+            if stream_url:
+                logger.log_debug('AllDebrid: using prefetched link for {0}'.format(media_id))
+                return stream_url
             url = '{0}/link/unlock?agent={1}&apikey={2}&link={3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), urllib_parse.quote_plus(media_id))
             result = self.net.http_GET(url, headers=self.headers).content
         except urllib_error.HTTPError as e:
@@ -119,16 +325,98 @@ class AllDebridResolver(ResolveUrl):
 
         raise ResolverError('AllDebrid: {0}'.format(i18n('no_stream')))
 
-    def __check_cache(self, media_id):
-        url = '{0}/magnet/instant?agent={1}&apikey={2}&magnets[]={3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), media_id.lower())
+    def __get_registered_transfer(self, _hash):
+        """
+        Return (transfer_id, transfer_info) for a finished transfer of this
+        magnet that is still on the account, or (None, None).
+        """
+        entry = self.registry.get(_hash)
+        if entry:
+            transfer_info = self.__list_transfer(entry['id'])
+            if transfer_info and transfer_info.get('statusCode') == 4 and transfer_info.get('links'):
+                logger.log_debug('AllDebrid: reusing transfer {0} for BTIH {1}'.format(entry['id'], _hash))
+                return entry['id'], transfer_info
+            self.registry.remove(_hash)
+        return None, None
+
+    def __register_transfer(self, _hash, transfer_id, transfer_info):
+        """
+        Keep a finished transfer for repeat plays, returns False if it is not kept.
+        Transfers evicted from the registry are deleted before returning, waiting
+        at most transfer_delete_timeout seconds so the plugin exiting right after
+        does not leave them on the account.
+        """
+        if not transfer_info or transfer_info.get('statusCode', 4) != 4 or not transfer_info.get('links'):
+            return False
+        files = [link.get('filename') for link in transfer_info.get('links')]
+        cleanups = []
+        for evicted_id in self.registry.put(_hash, transfer_id, files):
+            cleanup = threading.Thread(target=self.__delete_transfer, args=(evicted_id,))
+            cleanup.daemon = True
+            cleanup.start()
+            cleanups.append(cleanup)
+        deadline = time.time() + transfer_delete_timeout
+        for cleanup in cleanups:
+            cleanup.join(max(0, deadline - time.time()))
+        return True
+
+    def __prefetch_unlocks(self, links):
+        threads = {}
+        for link in links:
+            if self.__get_unlocked(link):
+                continue
+            thread = threading.Thread(target=self.__prefetch_unlock, args=(link,))
+            thread.daemon = True
+            thread.start()
+            threads[link] = thread
+        return threads
+
+    def __prefetch_unlock(self, link):
+        try:
+            url = '{0}/link/unlock?agent={1}&apikey={2}&link={3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), urllib_parse.quote_plus(link))
+            js_result = json.loads(self.net.http_GET(url, headers=self.headers).content)
+            # stream hosters need a quality pick, those are left to the normal path
+            if js_result.get('status', False) == "success" and js_result.get('data').get('link'):
+                with self.unlocked_lock:
+                    self.unlocked_links[link] = (js_result.get('data').get('link'), time.time())
+        except Exception as e:
+            logger.log_debug('AllDebrid: prefetch unlock failed for {0}: {1}'.format(link, e))
+
+    def __get_unlocked(self, link):
+        with self.unlocked_lock:
+            unlocked = self.unlocked_links.get(link)
+            if unlocked and time.time() - unlocked[1] < unlock_cache_ttl:
+                return unlocked[0]
+            self.unlocked_links.pop(link, None)
+        return None
+
+    def check_cache_many(self, hashes):
+        """
+        Return {hash: instant} for the given hashes (keys lowercased).
+        Answers already in the local debrid cache are used as is, the rest
+        are checked with a single magnet/instant call.
+        """
+        hashes = [h.lower() for h in hashes]
+        results = self.__get_local_cache(hashes)
+        unknown = [h for h in hashes if h not in results]
+        if not unknown:
+            logger.log_debug('AllDebrid: cache status for {0} hashes read from local cache'.format(len(hashes)))
+            return results
+
+        query = '&'.join('magnets[]={0}'.format(urllib_parse.quote_plus(h)) for h in unknown)
+        url = '{0}/magnet/instant?agent={1}&apikey={2}&{3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), query)
         result = self.net.http_GET(url, headers=self.headers).content
         result = json.loads(result)
         if result.get('status') == "success":
+            fetched = {}
             magnets = result.get('data').get('magnets')
+            unknown = set(unknown)
             for magnet in magnets:
-                if media_id.lower() == magnet.get('magnet').lower() or media_id.lower() == magnet.get('hash').lower():
-                    response = magnet.get('instant', False)
-                    return response
+                for h in (magnet.get('magnet', '').lower(), magnet.get('hash', '').lower()):
+                    if h in unknown:
+                        fetched[h] = magnet.get('instant', False)
+            self.__set_local_cache(fetched)
+            results.update(fetched)
         else:
             ecode = result.get('error', {}).get('code', '')
             if ecode == "AUTH_BLOCKED":
@@ -137,7 +425,50 @@ class AllDebridResolver(ResolveUrl):
             elif ecode == "AUTH_USER_BANNED":
                 logger.log_debug('Exception during AD auth: {0}'.format(ecode))
                 raise ResolverError(i18n('banned'))
-            return False
+        return results
+
+    def __get_local_cache(self, hashes):
+        results = {}
+        dbfile = xbmcvfs.translatePath(debrid_cache_db)
+        if not hashes or not os.path.exists(dbfile):
+            return results
+        try:
+            dbcon = sqlite3.connect(dbfile, timeout=5.0)
+            rows = dbcon.execute("SELECT hash, cached FROM debrid_data WHERE debrid='ad' AND expires > ? AND hash in ({0})".format(', '.join('?' for _ in hashes)),
+                                 [int(time.time())] + hashes).fetchall()
+            dbcon.close()
+            results = dict((row[0], row[1] == 'True') for row in rows)
+        except Exception as e:
+            logger.log_debug('AllDebrid: local cache read failed: {0}'.format(e))
+        return results
+
+    def __set_local_cache(self, results):
+        dbfile = xbmcvfs.translatePath(debrid_cache_db)
+        if not results or not os.path.exists(dbfile):
+            return
+        try:
+            now = int(time.time())
+            dbcon = sqlite3.connect(dbfile, timeout=5.0, isolation_level=None)
+            dbcon.execute('BEGIN IMMEDIATE')
+            uncached = [h for h, instant in results.items() if not instant]
+            misses = {}
+            if uncached:
+                rows = dbcon.execute("SELECT hash, misses FROM debrid_data WHERE debrid='ad' AND cached='False' AND hash in ({0})".format(', '.join('?' for _ in uncached)),
+                                     uncached).fetchall()
+                misses = dict((row[0], row[1] or 0) for row in rows)
+            rows = []
+            for h, instant in results.items():
+                if instant:
+                    rows.append((h, 'True', now + debrid_cache_ttl['cached'], 0))
+                else:
+                    miss_count = misses.get(h, 0) + 1
+                    ttl = min(debrid_cache_ttl['uncached'] * 2 ** (miss_count - 1), debrid_cache_max_uncached_ttl)
+                    rows.append((h, 'False', now + ttl, miss_count))
+            dbcon.executemany("REPLACE INTO debrid_data (hash, debrid, cached, expires, misses) VALUES (?, 'ad', ?, ?, ?)", rows)
+            dbcon.execute('COMMIT')
+            dbcon.close()
+        except Exception as e:
+            logger.log_debug('AllDebrid: local cache write failed: {0}'.format(e))
 
     def __list_transfer(self, transfer_id):
         url = '{0}/magnet/status?agent={1}&apikey={2}&id={3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), transfer_id)
@@ -160,6 +491,39 @@ class AllDebridResolver(ResolveUrl):
                 raise ResolverError(i18n('banned'))
             return {}
 
+    def __poll_transfer(self, transfer_id, transfer_info, session, counter):
+        """
+        Fetch the changes to a transfer using magnet/status live mode.
+        Only fields that changed since `counter` are returned by the API and
+        merged into transfer_info; a fullsync response replaces it.
+        """
+        url = '{0}/magnet/status?agent={1}&apikey={2}&session={3}&counter={4}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), session, counter)
+        result = json.loads(self.net.http_GET(url, headers=self.headers).content)
+        if result.get('status', False) != "success":
+            return self.__list_transfer(transfer_id), counter
+
+        data = result.get('data')
+        magnets = data.get('magnets') or []
+        if not isinstance(magnets, list):
+            magnets = [magnets]
+        for magnet in magnets:
+            if magnet.get('id') == transfer_id:
+                if data.get('fullsync'):
+                    transfer_info = magnet
+                else:
+                    transfer_info.update(magnet)
+        return transfer_info, data.get('counter', counter)
+
+    def __wait_for_links(self, transfer_id, transfer_info, tries=4):
+        delay = poll_start
+        for _ in range(tries):
+            if transfer_info.get('links'):
+                break
+            common.kodi.sleep(int(1000 * delay))
+            transfer_info = self.__list_transfer(transfer_id)
+            delay *= 2
+        return transfer_info
+
     def __create_transfer(self, media_id):
         url = '{0}/magnet/upload?agent={1}&apikey={2}&magnets[]={3}'.format(api_url, urllib_parse.quote_plus(AGENT), self.get_setting('token'), media_id)
         result = json.loads(self.net.http_GET(url, headers=self.headers).content)
@@ -168,7 +532,8 @@ class AllDebridResolver(ResolveUrl):
             magnets = result.get('data').get('magnets')
             for magnet in magnets:
                 if media_id in magnet.get('magnet') or media_id.lower() == magnet.get('hash').lower():
-                    return magnet.get('id')
+                    self.__set_local_cache({media_id.lower(): bool(magnet.get('ready'))})
+                    return magnet
         else:
             ecode = result.get('error', {}).get('code', '')
             if ecode == "AUTH_BLOCKED":
@@ -177,7 +542,7 @@ class AllDebridResolver(ResolveUrl):
             elif ecode == "AUTH_USER_BANNED":
                 logger.log_debug('Exception during AD auth: {0}'.format(ecode))
                 raise ResolverError(i18n('banned'))
-            return ''
+        return {}
 
     def __initiate_transfer(self, transfer_id, interval=5):
         try:
@@ -186,10 +551,14 @@ class AllDebridResolver(ResolveUrl):
                 line1 = transfer_info.get('filename')
                 line2 = i18n('ad_uptobox')
                 line3 = transfer_info.get('status')
+                session = random.randint(1, 2 ** 31)
+                counter = 0
+                delay = poll_start
                 with common.kodi.ProgressDialog('ResolveURL AllDebrid {0}'.format(i18n('transfer')), line1, line2, line3) as pd:
                     while not transfer_info.get('statusCode') == 4:
-                        common.kodi.sleep(1000 * interval)
-                        transfer_info = self.__list_transfer(transfer_id)
+                        common.kodi.sleep(int(1000 * delay * random.uniform(1 - poll_jitter, 1 + poll_jitter)))
+                        delay = min(interval, delay * poll_backoff)
+                        transfer_info, counter = self.__poll_transfer(transfer_id, transfer_info, session, counter)
                         file_size = transfer_info.get('size')
                         file_size2 = round(float(file_size) / (1000 ** 3), 2)
                         line1 = transfer_info.get('filename')
@@ -224,9 +593,10 @@ class AllDebridResolver(ResolveUrl):
                             self.__delete_transfer(transfer_id)
                             raise ResolverError('{0} ID {1} :: {2}'.format(i18n('transfer'), transfer_id, transfer_info.get('status')))
 
-                common.kodi.sleep(1000 * interval)  # allow api time to generate the links
+                # links are usually ready with statusCode 4, only wait if they are not
+                transfer_info = self.__wait_for_links(transfer_id, transfer_info)
 
-            return
+            return transfer_info
 
         except Exception as e:
             self.__delete_transfer(transfer_id)
@@ -307,17 +677,25 @@ class AllDebridResolver(ResolveUrl):
             if url.lower().startswith('magnet:') and self.get_setting('torrents') == 'true':
                 return True
             if self.hosters is None:
-                self.hosters = self.get_all_hosters()
+                self.hosters = HosterMatcher(self.get_all_hosters())
 
-            for regexp in self.hosters:
-                if re.search(regexp, url):
-                    logger.log_debug('AllDebrid Match found')
-                    return True
+            if self.hosters.match(url):
+                logger.log_debug('AllDebrid Match found')
+                return True
         elif host:
             if self.hosts is None:
                 self.hosts = self.get_hosts()
-
-            if any(host in item for item in self.hosts):
+                # every full domain, every parent domain and every bare label, for set lookups
+                self.host_names = set()
+                for item in self.hosts:
+                    labels = item.lower().split('.')
+                    self.host_names.update('.'.join(labels[i:]) for i in range(max(1, len(labels) - 1)))
+                    self.host_names.update(labels[:-1] if len(labels) > 1 else labels)
+
+            host = host.lower()
+            if host.startswith('www.'):
+                host = host[4:]
+            if host in self.host_names:
                 return True
 
         return False
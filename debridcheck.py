@@ -3,13 +3,17 @@
 ##-- Please retain this credit  --##
 ##-- Edited by MrBlamo for the Asguard addon --##
 
-import abc, logging, os, sys, time, datetime
+import abc, contextlib, logging, os, sys, time, datetime
+import queue
+import threading
 import sqlite3
 import json, requests
 import cache, utils
 import kodi
 import urllib3
-from asguard_lib import utils2, control
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from asguard_lib import utils2, control, scraper_utils
 import xbmc, xbmcaddon, xbmcgui, xbmcvfs
 
 from threading import Thread
@@ -25,6 +29,51 @@ rd_enabled = (__r_url__.getSetting('RealDebridResolver_enabled') == 'true' and _
 ad_enabled = (__r_url__.getSetting('AllDebridResolver_enabled') == 'true' and __r_url__.getSetting('AllDebridResolver_token') != '')
 pm_enabled = (__r_url__.getSetting('PremiumizeMeResolver_enabled') == 'true' and __r_url__.getSetting('PremiumizeMeResolver_token') != '')
 progressDialog = progressDialogBG
+SWEEP_INTERVAL = 15 * 60
+CHUNK_THREADS = 10
+REQUEST_TIMEOUT = (5, 20)
+# Per provider chunk executor settings: concurrent requests, starting chunk size and chunk size bounds
+CHUNK_SETTINGS = {
+    'rd': {'in_flight': 4, 'size': 50, 'min_size': 10, 'max_size': 100},
+    'ad': {'in_flight': 4, 'size': 50, 'min_size': 10, 'max_size': 200},
+}
+FAST_RESPONSE = 2.0
+THROTTLE_BACKOFF = 1.0
+MAX_THROTTLES = 5
+PROVIDER_DEADLINE = 20
+# Local cache lifetime per debrid and outcome; negative results back off up to MAX_UNCACHED_TTL
+CACHE_TTL = {
+    'default': {'cached': datetime.timedelta(hours=24), 'uncached': datetime.timedelta(hours=1)},
+    'rd': {'cached': datetime.timedelta(hours=24), 'uncached': datetime.timedelta(hours=1)},
+    'ad': {'cached': datetime.timedelta(hours=24), 'uncached': datetime.timedelta(hours=1)},
+    'pm': {'cached': datetime.timedelta(hours=12), 'uncached': datetime.timedelta(hours=1)},
+}
+MAX_UNCACHED_TTL = datetime.timedelta(days=7)
+HISTORY_RETENTION = datetime.timedelta(days=30)
+DIALOG_TIMEOUT = 40
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(provider):
+    """
+    Return the shared keep-alive session for a debrid provider.
+    The connection pool is sized for CHUNK_THREADS concurrent requests and
+    429/5xx responses are retried with backoff.
+
+    :param provider: Debrid key ('rd', 'ad' or 'pm').
+    """
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                            allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CHUNK_THREADS, max_retries=retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[provider] = session
+    return session
 
 abstractstaticmethod = abc.abstractmethod
 class abstractclassmethod(classmethod):
@@ -51,6 +100,8 @@ class RDapi:
         self.refresh = __r_url__.getSetting('RealDebridResolver_refresh')
         self.rest_base_url = 'https://api.real-debrid.com/rest/1.0/'
         self.oauth_url = 'https://api.real-debrid.com/oauth/v2/'
+        self.session = get_session('rd')
+        self.status_code = None
 
     def _get(self, url):
         """
@@ -66,7 +117,9 @@ class RDapi:
             url += "?auth_token=%s" % self.token
         else:
             url += "&auth_token=%s" % self.token
-        response = requests.get(url).text
+        response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        self.status_code = response.status_code
+        response = response.text
         if 'bad_token' in response or 'Bad Request' in response:
             self.refreshToken()
             response = self._get(original_url)
@@ -80,7 +133,7 @@ class RDapi:
                 'code': self.refresh,
                 'grant_type': 'http://oauth.net/grant_type/device/1.0'}
         url = self.oauth_url + 'token'
-        response = requests.post(url, data=data)
+        response = self.session.post(url, data=data, timeout=REQUEST_TIMEOUT)
         response = json.loads(response.text)
         if 'access_token' in response: self.token = response['access_token']
         if 'refresh_token' in response: self.refresh = response['refresh_token']
@@ -109,6 +162,8 @@ class ADapi:
         self.base_url = 'https://api.alldebrid.com/v4/'
         self.token = __r_url__.getSetting('AllDebridResolver_token')
         self.user_agent = 'Asguard'
+        self.session = get_session('ad')
+        self.status_code = None
 
     def check_cache(self, hashes):
         data = {'magnets[]': hashes}
@@ -130,7 +185,9 @@ class ADapi:
             return None
         url = self.base_url + url + '?agent=%s&apikey=%s' % (self.user_agent, self.token)
         logging.debug(f"ADapi POST URL: {url}")
-        resp = requests.post(url, data=data).json()
+        resp = self.session.post(url, data=data, timeout=REQUEST_TIMEOUT)
+        self.status_code = resp.status_code
+        resp = resp.json()
         logging.debug(f"ADapi POST response: {resp}")
         if resp.get('status') == 'success':
             if 'data' in resp:
@@ -142,6 +199,7 @@ class PMapi:
         __metaclass__ = abc.ABCMeta
         self.base_url = 'https://www.premiumize.me/api/'
         self.token = __r_url__.getSetting('PremiumizeMeResolver_token')
+        self.session = get_session('pm')
 
     def check_cache(self, hashes):
         url = "cache/check"
@@ -160,7 +218,7 @@ class PMapi:
         if self.token == '' and not 'token' in url: return None
         headers = {'Authorization': 'Bearer %s' % self.token}
         if not 'token' in url: url = self.base_url + url
-        response = requests.post(url, data=data, headers=headers).text
+        response = self.session.post(url, data=data, headers=headers, timeout=REQUEST_TIMEOUT).text
         try: resp = utils.json_loads_as_str(response)
         except: resp = utils._byteify(response)
         return resp
@@ -175,6 +233,7 @@ class DebridCheck:
         self.db_cache = DebridCache()
         self.db_cache.check_database()
         self.cached_hashes = []
+        self.cached_index = {}
         self.main_threads = []
         self.rd_cached_hashes = []
         self.rd_hashes_unchecked = []
@@ -189,92 +248,257 @@ class DebridCheck:
         self.pm_process_results = []
         self.starting_debrids = []
         self.starting_debrids_display = []
+        self.local_results = []
+        self.original_hashes = {}
+        self.results_queue = queue.Queue()
+        self.writer = None
+        self.timings = {'local_cache': 0.0, 'network': 0.0, 'ui': 0.0}
 
     def run(self, hash_list):
         """
         Run the debrid cache checking process.
+        The progress dialog is only shown when a provider has to be queried.
 
         :param hash_list: List of torrent hashes to check.
         :return: Tuple of cached hashes for Real-Debrid, AllDebrid, and Premiumize.me.
         """
-        xbmc.sleep(500)
-        self.hash_list = hash_list
+        start_time = time.time()
+        self._prepare(hash_list)
+        self.timings['local_cache'] = time.time() - start_time
+        if self.starting_debrids:
+            self._start_checkers()
+            self.debrid_check_dialog()
+            [i.join() for i in self.main_threads]
+            local_start = time.time()
+            self._add_to_local_cache()
+            self.timings['local_cache'] += time.time() - local_start
+        logging.debug('DebridCheck timings: local cache %.3fs, network %.3fs, ui %.3fs, total %.3fs' %
+                      (self.timings['local_cache'], self.timings['network'], self.timings['ui'], time.time() - start_time))
+        return self._original_hashes(self.rd_cached_hashes), self._original_hashes(self.ad_cached_hashes), self._original_hashes(self.pm_cached_hashes)
+
+    def iter_results(self, hash_list, deadline=None):
+        """
+        Check the given hashes and yield results as soon as they are known.
+        Local cache hits are yielded first, then each provider's results as
+        its chunks complete. A provider still running past its deadline is
+        no longer waited on. Results are written to the local cache by the
+        writer thread once every provider finishes, also when the consumer
+        stops iterating early.
+
+        :param hash_list: List of torrent hashes to check.
+        :param deadline: Seconds to wait per provider, either a number or a
+                         dict of {debrid: seconds}. Defaults to PROVIDER_DEADLINE.
+        :return: Generator of (debrid, hash, cached) tuples.
+        """
+        if deadline is None: deadline = PROVIDER_DEADLINE
+        self._prepare(hash_list)
+        for debrid, _hash, cached in self.local_results:
+            for original in self.original_hashes.get(_hash, [_hash]):
+                yield debrid, original, cached
+        if not self.starting_debrids:
+            return
+
+        self._start_checkers()
+        # non-daemon, so the results are written even if the plugin exits first
+        self.writer = Thread(target=self._finish_checkers)
+        self.writer.start()
+        start_time = time.time()
+        deadlines = {}
+        for debrid, _name, _checker in self.starting_debrids:
+            seconds = deadline.get(debrid, PROVIDER_DEADLINE) if isinstance(deadline, dict) else deadline
+            deadlines[debrid] = start_time + seconds
+
+        while deadlines:
+            now = time.time()
+            for debrid in [d for d in deadlines if deadlines[d] <= now]:
+                logging.debug(f"{debrid} cache check passed its deadline")
+                del deadlines[debrid]
+            if not deadlines: break
+            try:
+                debrid, _hash, cached = self.results_queue.get(timeout=min(deadlines.values()) - now)
+            except queue.Empty:
+                continue
+            if _hash is None:
+                deadlines.pop(debrid, None)
+            elif debrid in deadlines:
+                for original in self.original_hashes.get(_hash, [_hash]):
+                    yield debrid, original, cached
+
+    def run_with_callback(self, hash_list, callback, deadline=None):
+        """
+        Run iter_results on a background thread, calling callback(debrid, hash, cached)
+        for every result.
+
+        :return: The started thread.
+        """
+        def consume():
+            for debrid, _hash, cached in self.iter_results(hash_list, deadline):
+                callback(debrid, _hash, cached)
+
+        consumer = Thread(target=consume)
+        consumer.daemon = True
+        consumer.start()
+        return consumer
+
+    def _prepare(self, hash_list):
+        self.hash_list = self._canonical_hashes(hash_list)
         self._query_local_cache(self.hash_list)
+        self.db_cache.sweep_expired()
         if rd_enabled:
-            self.rd_cached_hashes = [str(i[0]) for i in self.cached_hashes if str(i[1]) == 'rd' and str(i[2]) == 'True']
-            self.rd_hashes_unchecked = [i for i in self.hash_list if not any([h for h in self.cached_hashes if str(h[0]) == i and str(h[1]) =='rd'])]
-            if self.rd_hashes_unchecked: self.starting_debrids.append(('Real-Debrid', self.RD_cache_checker))
+            self.rd_cached_hashes, rd_uncached, self.rd_hashes_unchecked = self._partition_hashes('rd')
+            self._add_local_results('rd', self.rd_cached_hashes, rd_uncached)
+            if self.rd_hashes_unchecked: self.starting_debrids.append(('rd', 'Real-Debrid', self.RD_cache_checker))
         if ad_enabled:
-            self.ad_cached_hashes = [str(i[0]) for i in self.cached_hashes if str(i[1]) == 'ad' and str(i[2]) == 'True']
-            self.ad_hashes_unchecked = [i for i in self.hash_list if not any([h for h in self.cached_hashes if str(h[0]) == i and str(h[1]) =='ad'])]
-            if self.ad_hashes_unchecked: self.starting_debrids.append(('AllDebrid', self.AD_cache_checker))
+            self.ad_cached_hashes, ad_uncached, self.ad_hashes_unchecked = self._partition_hashes('ad')
+            self._add_local_results('ad', self.ad_cached_hashes, ad_uncached)
+            if self.ad_hashes_unchecked: self.starting_debrids.append(('ad', 'AllDebrid', self.AD_cache_checker))
         if pm_enabled:
-            self.pm_cached_hashes = [str(i[0]) for i in self.cached_hashes if str(i[1]) == 'pm' and str(i[2]) == 'True']
-            self.pm_hashes_unchecked = [i for i in self.hash_list if not any([h for h in self.cached_hashes if str(h[0]) == i and str(h[1]) =='pm'])]
-            if self.pm_hashes_unchecked: self.starting_debrids.append(('Premiumize.me', self.PM_cache_checker))
-        if self.starting_debrids:
-            for i in list(range(len(self.starting_debrids))):
-                self.main_threads.append(Thread(target=self.starting_debrids[i][1]))
-                self.starting_debrids_display.append((self.main_threads[i].getName(), self.starting_debrids[i][0]))
-            [i.start() for i in self.main_threads]
-            [i.join() for i in self.main_threads]
-            self.debrid_check_dialog()
-        xbmc.sleep(500)
-        return self.rd_cached_hashes, self.ad_cached_hashes, self.pm_cached_hashes
+            self.pm_cached_hashes, pm_uncached, self.pm_hashes_unchecked = self._partition_hashes('pm')
+            self._add_local_results('pm', self.pm_cached_hashes, pm_uncached)
+            if self.pm_hashes_unchecked: self.starting_debrids.append(('pm', 'Premiumize.me', self.PM_cache_checker))
 
-    def debrid_check_dialog(self):
-        timeout = 20
-        progressDialog.create('Checking debrid cache, please wait..')
-        #progressDialog.update(0)
+    def _canonical_hashes(self, hash_list):
+        """
+        Normalise hashes to lowercase hex and drop duplicates, keeping order.
+        The caller's original strings are remembered in original_hashes.
+
+        :param hash_list: List of torrent hashes as supplied by the scrapers.
+        :return: List of unique canonical hashes.
+        """
+        self.original_hashes = {}
+        canonical = []
+        for original in hash_list:
+            _hash = self._normalise_hash(original)
+            if _hash not in self.original_hashes:
+                self.original_hashes[_hash] = []
+                canonical.append(_hash)
+            if original not in self.original_hashes[_hash]:
+                self.original_hashes[_hash].append(original)
+        return canonical
+
+    @staticmethod
+    def _normalise_hash(_hash):
+        _hash = str(_hash).strip()
+        if len(_hash) == 32:
+            try: return scraper_utils.base32_to_hex(_hash.upper(), 'DebridCheck')
+            except Exception: pass
+        return _hash.lower()
+
+    def _original_hashes(self, hash_list):
+        return [original for _hash in hash_list for original in self.original_hashes.get(_hash, [_hash])]
+
+    def _add_local_results(self, debrid, cached, uncached):
+        self.local_results.extend((debrid, h, True) for h in cached)
+        self.local_results.extend((debrid, h, False) for h in uncached)
+
+    def _start_checkers(self):
+        for debrid, name, checker in self.starting_debrids:
+            thread = Thread(target=self._run_checker, args=(debrid, checker))
+            self.main_threads.append(thread)
+            self.starting_debrids_display.append((thread.getName(), name))
+        [i.start() for i in self.main_threads]
+
+    def _run_checker(self, debrid, checker):
         start_time = time.time()
-        for i in list(range(0, 200)):
+        try: checker()
+        finally:
+            self.timings['network'] = max(self.timings['network'], time.time() - start_time)
+            self.results_queue.put((debrid, None, None))
+
+    def _finish_checkers(self):
+        [i.join() for i in self.main_threads]
+        self._add_to_local_cache()
+
+    def _publish(self, debrid, _hash, cached):
+        self.results_queue.put((debrid, _hash, cached == 'True'))
+
+    def debrid_check_dialog(self, timeout=DIALOG_TIMEOUT):
+        """
+        Show check progress until every provider has finished.
+        Updates are driven by the checkers' completion events on results_queue;
+        per-hash results are skipped so the dialog only changes when a
+        provider finishes.
+        """
+        ui_start = time.time()
+        progressDialog.create('Checking debrid cache, please wait..')
+        remaining = {debrid: name for debrid, name, _checker in self.starting_debrids}
+        total = len(remaining)
+        self.timings['ui'] += time.time() - ui_start
+        self._update_dialog(total, remaining)
+        end_time = time.time() + timeout
+        monitor = xbmc.Monitor()
+        while remaining and time.time() < end_time:
+            if monitor.abortRequested(): return sys.exit()
             try:
-                if xbmc.abortRequested(): return sys.exit()
-                alive_threads = [x.getName() for x in self.main_threads if x.is_alive() is True]
-                remaining_debrids = [x[1] for x in self.starting_debrids_display if x[0] in alive_threads]
-                current_time = time.time()
-                current_progress = current_time - start_time
-                try:
-                    percent = int((current_progress/float(timeout))*100)
-                    msg = 'Remaining Debrid Checks: %s' % ', '.join(remaining_debrids).upper()
-                    progressDialog.update(percent, message=msg)
-                except: pass
-                time.sleep(0.2)
-                if len(alive_threads) == 0 or progressDialog.isFinished(): break
-            except Exception:
-                pass
+                debrid, _hash, _cached = self.results_queue.get(timeout=min(0.5, max(0, end_time - time.time())))
+            except queue.Empty:
+                continue
+            if _hash is not None: continue
+            remaining.pop(debrid, None)
+            if remaining: self._update_dialog(total, remaining)
+        ui_start = time.time()
         try:
             progressDialog.close()
         except Exception:
             pass
-        xbmc.sleep(200)
+        self.timings['ui'] += time.time() - ui_start
+
+    def _update_dialog(self, total, remaining):
+        ui_start = time.time()
+        try:
+            percent = int(((total - len(remaining)) / float(total)) * 100)
+            msg = 'Remaining Debrid Checks: %s' % ', '.join(remaining.values()).upper()
+            progressDialog.update(percent, message=msg)
+        except: pass
+        self.timings['ui'] += time.time() - ui_start
 
     def RD_cache_checker(self):
-        hash_chunk_list = list(utils2.chunks(self.rd_hashes_unchecked, 100))
-        for item in hash_chunk_list: self.rd_query_threads.append(Thread(target=self._rd_lookup, args=(item,)))
-        [i.start() for i in self.rd_query_threads]
-        [i.join() for i in self.rd_query_threads]
-        self._add_to_local_cache(self.rd_process_results, 'rd')
+        self._run_chunked('rd', self.rd_hashes_unchecked, self._rd_lookup, self.rd_query_threads)
 
     def AD_cache_checker(self):
-        hash_chunk_list = list(utils2.chunks(self.ad_hashes_unchecked, 100))
-        for item in hash_chunk_list: self.ad_query_threads.append(Thread(target=self._ad_lookup, args=(item,)))
-        [i.start() for i in self.ad_query_threads]
-        [i.join() for i in self.ad_query_threads]
-        self._add_to_local_cache(self.ad_process_results, 'ad')
+        self._run_chunked('ad', self.ad_hashes_unchecked, self._ad_lookup, self.ad_query_threads)
+
+    def _run_chunked(self, debrid, hashes, lookup, query_threads):
+        """
+        Run a chunked lookup with a bounded number of requests in flight.
+
+        :param debrid: Debrid key used to pick the CHUNK_SETTINGS entry.
+        :param hashes: List of torrent hashes to check.
+        :param lookup: Callable taking a chunk, returning True when throttled.
+        :param query_threads: List the worker threads are recorded in.
+        """
+        settings = CHUNK_SETTINGS[debrid]
+        chunk_queue = ChunkQueue(hashes, settings['size'], settings['min_size'], settings['max_size'])
+
+        def worker():
+            while True:
+                chunk = chunk_queue.get()
+                if not chunk: return
+                start_time = time.time()
+                throttled = lookup(chunk)
+                chunk_queue.report(chunk, time.time() - start_time, throttled)
+                if throttled: time.sleep(THROTTLE_BACKOFF)
+
+        workers = min(settings['in_flight'], max(1, -(-len(hashes) // settings['size'])))
+        for _ in range(workers): query_threads.append(Thread(target=worker))
+        [i.start() for i in query_threads]
+        [i.join() for i in query_threads]
+        logging.debug(f"{debrid} chunked lookup: {workers} workers, final chunk size {chunk_queue.size}, throttled {chunk_queue.throttles} times")
 
     def PM_cache_checker(self):
         self._pm_lookup(self.pm_hashes_unchecked)
-        self._add_to_local_cache(self.pm_process_results, 'pm')
 
     def _rd_lookup(self, chunk):
         """
         Perform the Real-Debrid cache lookup for a chunk of hashes.
 
         :param chunk: List of torrent hashes to check.
+        :return: True if Real-Debrid throttled the request.
         """
         try:
-            rd_cache_get = RDapi().check_cache(chunk)
+            rd_api = RDapi()
+            rd_cache_get = rd_api.check_cache(chunk)
+            if rd_api.status_code == 429: return True
             for h in chunk:
                 cached = 'False'
                 if h in rd_cache_get:
@@ -283,26 +507,36 @@ class DebridCheck:
                         self.rd_cached_hashes.append(h)
                         cached = 'True'
                 self.rd_process_results.append((h, cached))
+                self._publish('rd', h, cached)
         except: pass
+        return False
 
     def _ad_lookup(self, hash_list):
         """
         Perform the AllDebrid cache lookup for a list of hashes.
 
         :param hash_list: List of torrent hashes to check.
+        :return: True if AllDebrid throttled the request.
         """
         try:
-            ad_cache = ADapi().check_cache(hash_list)
+            ad_api = ADapi()
+            ad_cache = ad_api.check_cache(hash_list)
+            if ad_api.status_code == 429: return True
             if isinstance(ad_cache, list):
                 for i in ad_cache:
+                    _hash = i['hash'].lower()
                     cached = 'False'
                     if i['instant'] == True:
-                        self.ad_cached_hashes.append(i['hash'])
+                        self.ad_cached_hashes.append(_hash)
                         cached = 'True'
-                    self.ad_process_results.append((i['hash'], cached))
+                    self.ad_process_results.append((_hash, cached))
+                    self._publish('ad', _hash, cached)
             else:
-                for i in hash_list: self.ad_process_results.append((i, 'False'))
+                for i in hash_list:
+                    self.ad_process_results.append((i, 'False'))
+                    self._publish('ad', i, 'False')
         except: pass
+        return False
 
     def _pm_lookup(self, hash_list):
         try:
@@ -313,6 +547,7 @@ class DebridCheck:
                     self.pm_cached_hashes.append(h)
                     cached = 'True'
                 self.pm_process_results.append((h, cached))
+                self._publish('pm', h, cached)
         except: pass
 
     def _query_local_cache(self, _hash):
@@ -324,72 +559,280 @@ class DebridCheck:
         cached = self.db_cache.get_all(_hash)
         if cached:
             self.cached_hashes = cached
+        self.cached_index = self._index_local_cache(self.cached_hashes)
 
-    def _add_to_local_cache(self, _hash, debrid):
-        self.db_cache.set_many(_hash, debrid)
+    @staticmethod
+    def _index_local_cache(cached_hashes):
+        """
+        Build a per-debrid lookup of the local cache rows.
+
+        :param cached_hashes: Rows returned by DebridCache.get_all.
+        :return: Dict of {debrid: {hash: cached}} where cached is a bool.
+        """
+        index = {}
+        for row in cached_hashes:
+            index.setdefault(str(row[1]), {})[str(row[0])] = str(row[2]) == 'True'
+        return index
+
+    def _partition_hashes(self, debrid):
+        """
+        Split the requested hashes using the local cache index for one debrid.
+
+        :param debrid: Debrid key as stored in the cache ('rd', 'ad' or 'pm').
+        :return: Tuple of (cached, uncached, unchecked) hash lists.
+        """
+        cached, uncached, unchecked = [], [], []
+        debrid_index = self.cached_index.get(debrid, {})
+        for h in self.hash_list:
+            status = debrid_index.get(h)
+            if status is None: unchecked.append(h)
+            elif status: cached.append(h)
+            else: uncached.append(h)
+        return cached, uncached, unchecked
+
+    def _add_to_local_cache(self):
+        written = self.db_cache.set_many_debrids({'rd': self.rd_process_results,
+                                                  'ad': self.ad_process_results,
+                                                  'pm': self.pm_process_results})
+        logging.debug(f"DebridCache rows written: {written}")
+        logging.debug(f"DebridCache connection stats: {self.db_cache.connection.stats()}")
+
+class ChunkQueue:
+    """
+    Hands out hash chunks to the lookup workers.
+    The chunk size grows while responses come back quickly and is halved
+    when the provider answers 429, in which case the chunk is queued again.
+    """
+    def __init__(self, hashes, size, min_size, max_size):
+        self.hashes = list(hashes)
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            chunk = self.hashes[:self.size]
+            del self.hashes[:self.size]
+            return chunk
+
+    def report(self, chunk, elapsed, throttled):
+        with self._lock:
+            if throttled:
+                self.throttles += 1
+                self.size = max(self.min_size, self.size // 2)
+                if self.throttles <= MAX_THROTTLES:
+                    self.hashes[:0] = chunk
+            elif elapsed < FAST_RESPONSE:
+                self.size = min(self.max_size, self.size + self.size // 2)
+
+class DebridCacheConnection:
+    """
+    Connection manager for debridcache.db.
+    Keeps one connection per thread, runs the database in WAL mode and
+    counts how often a writer had to wait for the database lock.
+    """
+    def __init__(self, dbfile, timeout=40.0):
+        self.dbfile = dbfile
+        self.timeout = timeout
+        self.lock_waits = 0
+        self.lock_wait_time = 0.0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the calling thread's connection, opening it on first use.
+        """
+        dbcon = getattr(self._local, 'dbcon', None)
+        if dbcon is None:
+            dbcon = sqlite3.connect(self.dbfile, timeout=0, isolation_level=None)
+            dbcon.execute('PRAGMA journal_mode=WAL')
+            dbcon.execute('PRAGMA synchronous=NORMAL')
+            self._local.dbcon = dbcon
+        return dbcon
+
+    def execute(self, sql, params=()):
+        return self.get().execute(sql, params).fetchall()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Run the enclosed statements in a single write transaction.
+        Retries BEGIN IMMEDIATE while another writer holds the lock.
+        """
+        dbcon = self.get()
+        start_time = time.time()
+        waited = False
+        while True:
+            try:
+                dbcon.execute('BEGIN IMMEDIATE')
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or time.time() - start_time > self.timeout: raise
+                waited = True
+                time.sleep(0.05)
+        if waited:
+            with self._stats_lock:
+                self.lock_waits += 1
+                self.lock_wait_time += time.time() - start_time
+        try:
+            yield dbcon.cursor()
+            dbcon.execute('COMMIT')
+        except:
+            dbcon.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        return {'lock_waits': self.lock_waits, 'lock_wait_time': round(self.lock_wait_time, 3)}
 
 class DebridCache:
     """
     Class to handle local caching of debrid data.
     Uses SQLite for storage.
     """
+    _connections = {}
+    _connections_lock = threading.Lock()
+
     def __init__(self):
         __metaclass__ = abc.ABCMeta
         self.dbfile = os.path.join(dataPath, 'debridcache.db')
+        self.sweeper = None
+        with DebridCache._connections_lock:
+            if self.dbfile not in DebridCache._connections:
+                DebridCache._connections[self.dbfile] = DebridCacheConnection(self.dbfile)
+            self.connection = DebridCache._connections[self.dbfile]
 
     def get_all(self, hash_list):
         result = None
         try:
             current_time = self._get_timestamp(datetime.datetime.now())
-            dbcon = sqlite3.connect(self.dbfile, timeout=40.0)
-            dbcur = dbcon.cursor()
-            dbcur.execute('SELECT * FROM debrid_data WHERE hash in ({0})'.format(', '.join('?' for _ in hash_list)), hash_list)
-            cache_data = dbcur.fetchall()
+            cache_data = self.connection.execute('SELECT * FROM debrid_data WHERE hash in ({0}) AND expires > ?'.format(', '.join('?' for _ in hash_list)), list(hash_list) + [current_time])
             if cache_data:
-                if cache_data[0][3] > current_time:
-                    result = cache_data
-                else:
-                    self.remove_many(cache_data)
+                result = cache_data
         except: pass
         return result
 
+    def remove_expired(self):
+        """
+        Delete rows that expired more than HISTORY_RETENTION ago.
+        Recently expired rows are never returned by get_all but are kept so
+        the negative-result backoff survives the expiry.
+        """
+        try:
+            current_time = self._get_timestamp(datetime.datetime.now() - HISTORY_RETENTION)
+            with self.connection.transaction() as dbcur:
+                dbcur.execute("DELETE FROM debrid_data WHERE expires <= ?", (current_time,))
+        except: pass
+
+    def sweep_expired(self, interval=SWEEP_INTERVAL):
+        """
+        Purge expired rows on a background thread, at most once per interval.
+        Every plugin call runs in a fresh interpreter, so the time of the last
+        sweep is kept in the debrid_meta table; it is claimed in a transaction
+        so only one of several concurrent calls sweeps.
+
+        :param interval: Minimum number of seconds between two sweeps.
+        :return: True if a sweep was started.
+        """
+        now = int(time.time())
+        try:
+            with self.connection.transaction() as dbcur:
+                row = dbcur.execute("SELECT value FROM debrid_meta WHERE key='last_sweep'").fetchone()
+                if row and now - row[0] < interval:
+                    return False
+                dbcur.execute("REPLACE INTO debrid_meta (key, value) VALUES ('last_sweep', ?)", (now,))
+        except Exception as e:
+            logging.error(f"DebridCache sweep check failed: {e}")
+            return False
+        # not a daemon: the DELETE is short and should not be cut off by the plugin exiting
+        self.sweeper = Thread(target=self.remove_expired)
+        self.sweeper.start()
+        return True
+
     def remove_many(self, old_cached_data):
         try:
             old_cached_data = [(str(i[0]),) for i in old_cached_data]
-            dbcon = sqlite3.connect(self.dbfile, timeout=40.0)
-            dbcur = dbcon.cursor()
-            dbcur.executemany("DELETE FROM debrid_data WHERE hash=?", old_cached_data)
-            dbcon.commit()
+            with self.connection.transaction() as dbcur:
+                dbcur.executemany("DELETE FROM debrid_data WHERE hash=?", old_cached_data)
         except: pass
 
-    def set_many(self, hash_list, debrid, expiration=datetime.timedelta(hours=1)):
+    def set_many(self, hash_list, debrid, expiration=None):
+        return self.set_many_debrids({debrid: hash_list}, expiration)
+
+    def set_many_debrids(self, results, expiration=None):
+        """
+        Write the results of several debrids in one transaction.
+        Existing rows for the same hash and debrid are replaced, so a
+        re-check refreshes both the cached flag and the expiry.
+
+        :param results: Dict of {debrid: [(hash, cached), ...]}.
+        :param expiration: How long the rows stay valid. Defaults to the
+                           CACHE_TTL policy for the debrid and outcome.
+        :return: Number of rows written.
+        """
+        written = 0
         try:
-            expires = self._get_timestamp(datetime.datetime.now() + expiration)
-            insert_list = [(i[0], debrid, i[1], expires) for i in hash_list]
-            dbcon = sqlite3.connect(self.dbfile, timeout=40.0)
-            dbcur = dbcon.cursor()
-            dbcur.executemany("INSERT INTO debrid_data VALUES (?, ?, ?, ?)", insert_list)
-            dbcon.commit()
-        except: pass
+            now = datetime.datetime.now()
+            with self.connection.transaction() as dbcur:
+                insert_list = []
+                for debrid, hash_list in results.items():
+                    misses = self._get_misses(dbcur, debrid, [i[0] for i in hash_list if i[1] != 'True'])
+                    for _hash, cached in hash_list:
+                        miss_count = 0 if cached == 'True' else misses.get(_hash, 0) + 1
+                        ttl = expiration or self._get_ttl(debrid, cached, miss_count)
+                        insert_list.append((_hash, debrid, cached, self._get_timestamp(now + ttl), miss_count))
+                if not insert_list: return written
+                dbcur.executemany("REPLACE INTO debrid_data (hash, debrid, cached, expires, misses) VALUES (?, ?, ?, ?, ?)", insert_list)
+                written = dbcur.rowcount
+        except Exception as e:
+            logging.error(f"DebridCache write failed: {e}")
+        return written
+
+    @staticmethod
+    def _get_misses(dbcur, debrid, hash_list):
+        """
+        Look up how many negative results in a row each hash already has.
+
+        :return: Dict of {hash: misses}.
+        """
+        misses = {}
+        for chunk in utils2.chunks(hash_list, 500):
+            dbcur.execute("SELECT hash, misses FROM debrid_data WHERE debrid=? AND cached='False' AND hash in ({0})".format(', '.join('?' for _ in chunk)), [debrid] + chunk)
+            misses.update((row[0], row[1] or 0) for row in dbcur.fetchall())
+        return misses
+
+    @staticmethod
+    def _get_ttl(debrid, cached, misses):
+        """
+        Pick the expiry for a result from CACHE_TTL.
+        Negative results start at the 'uncached' TTL and double with every
+        further negative result, up to MAX_UNCACHED_TTL.
+        """
+        policy = CACHE_TTL.get(debrid, CACHE_TTL['default'])
+        if cached == 'True':
+            return policy['cached']
+        return min(policy['uncached'] * (2 ** max(0, misses - 1)), MAX_UNCACHED_TTL)
 
     def check_database(self):
         if not os.path.exists(dataPath):
             makeFile(dataPath)
-        dbcon = sqlite3.connect(self.dbfile)
-        dbcur = dbcon.cursor()
-        dbcur.execute("""CREATE TABLE IF NOT EXISTS debrid_data
-                      (hash text not null, debrid text not null, cached text, expires integer, unique (hash, debrid))
-                        """)
-        dbcon.close()
+        with self.connection.transaction() as dbcur:
+            dbcur.execute("""CREATE TABLE IF NOT EXISTS debrid_data
+                          (hash text not null, debrid text not null, cached text, expires integer, misses integer default 0, unique (hash, debrid))
+                            """)
+            columns = [row[1] for row in dbcur.execute("PRAGMA table_info(debrid_data)").fetchall()]
+            if 'misses' not in columns:
+                dbcur.execute("ALTER TABLE debrid_data ADD COLUMN misses integer default 0")
+            dbcur.execute("CREATE INDEX IF NOT EXISTS debrid_data_expires ON debrid_data (expires)")
+            dbcur.execute("CREATE TABLE IF NOT EXISTS debrid_meta (key text primary key, value integer)")
 
     def clear_database(self):
         try:
-            dbcon = sqlite3.connect(self.dbfile)
-            dbcur = dbcon.cursor()
-            dbcur.execute("DELETE FROM debrid_data")
-            dbcur.execute("VACUUM")
-            dbcon.commit()
-            dbcon.close()
+            with self.connection.transaction() as dbcur:
+                dbcur.execute("DELETE FROM debrid_data")
+            self.connection.execute("VACUUM")
             return 'success'
         except: return 'failure'
 
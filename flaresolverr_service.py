@@ -20,9 +20,12 @@ import os
 import sys
 import json
 import time
+import hashlib
 import threading
 import subprocess
 import socket
+import collections
+import urllib.parse
 import requests
 import xbmc
 import xbmcgui
@@ -30,9 +33,33 @@ import xbmcaddon
 import log_utils
 import kodi
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 logger = log_utils.Logger.get_logger()
 addon = xbmcaddon.Addon('plugin.video.asguard')
 
+STARTUP_TIMEOUT = 60
+READY_POLL_INTERVAL = 0.25
+# Lifetime of a clearance whose cf_clearance cookie has no expiry of its own
+CLEARANCE_TTL = 30 * 60
+# Concurrent request.get calls sent to FlareSolverr; the rest wait in line
+MAX_CONCURRENT_SOLVES = 2
+# Browser sessions kept open, the least recently used one is destroyed to make
+# room, and the seconds of disuse after which a session is destroyed anyway
+MAX_SESSIONS = 4
+SESSION_IDLE_TTL = 10 * 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 5
+# Supervisor: seconds between health checks, failed /v1 probes before a
+# restart, and the memory (MB, process plus its Chromium children) that
+# triggers one
+HEALTH_CHECK_INTERVAL = 30
+HEALTH_CHECK_FAILURES = 3
+MAX_MEMORY_MB = 1024
+
 """
 FlareSolverr Service Integration Documentation
 =====================================
@@ -60,6 +87,9 @@ INTEGRATION STEPS:
    <setting id="flaresolverr_auto_start" type="boolean" label="Auto-start FlareSolverr" default="true"/>
    <setting id="flaresolverr_auto_port" type="boolean" label="Auto-select FlareSolverr port" default="true"/>
    <setting id="flaresolverr_port" type="number" label="FlareSolverr port" default="8191"/>
+   <setting id="flaresolverr_max_solves" type="number" label="Concurrent FlareSolverr solves" default="2"/>
+   <setting id="flaresolverr_max_memory" type="number" label="Restart FlareSolverr above (MB)" default="1024"/>
+   <setting id="flaresolverr_max_sessions" type="number" label="Open FlareSolverr browser sessions" default="4"/>
    ```
 
 4. Update scraper.py to use the service:
@@ -78,10 +108,14 @@ INTEGRATION STEPS:
 
 FEATURES:
 
-- Automatic download of FlareSolverr binary based on platform
+- Automatic download of FlareSolverr binary based on platform (resumable, size/SHA-256 verified)
 - Port conflict detection and automatic port selection
 - Process management (start/stop/restart)
+- Supervisor thread: /v1 health checks, memory limit and automatic restart (get_health())
+- Non-blocking startup with a readiness event (wait_until_ready)
 - Connection testing
+- Per-domain FlareSolverr sessions (bounded, idle ones closed) and cached Cloudflare clearances (request())
+- Solve queue with a concurrency limit, url coalescing and deadlines (get_stats())
 - Kodi notifications for status updates
 
 USAGE:
@@ -94,12 +128,20 @@ from asguard_lib.flaresolverr_service import get_flaresolverr_service
 # Get the service instance
 flaresolverr_service = get_flaresolverr_service()
 
-# Ensure it's running
+# Ensure it's running (start() returns immediately, the process starts in the background)
 if not flaresolverr_service.is_running():
     flaresolverr_service.start()
 
+# Only wait for it when a Cloudflare solve is actually needed
+if not flaresolverr_service.wait_until_ready(timeout=30):
+    return ''
+
 # Get the API URL for requests
 api_url = flaresolverr_service.get_api_url()
+
+# Or let the service fetch the page, reusing the domain's cf_clearance cookie
+# and user-agent and only solving through the browser when they are rejected
+html = flaresolverr_service.request(url, headers=headers, timeout=30)
 ```
 
 """
@@ -119,6 +161,38 @@ class FlareSolverrService:
         self.running = False
         self.thread = None
         self.stop_event = threading.Event()
+        self.ready_event = threading.Event()
+        self.start_lock = threading.Lock()
+
+        # Supervisor: health checks, restarts and the tail of the process output
+        self.supervisor = None
+        self.output_tail = collections.deque(maxlen=50)
+        self.health = {'checks': 0, 'failures': 0, 'restarts': 0, 'memory_mb': None, 'last_restart_reason': None}
+        try:
+            self.max_memory_mb = int(kodi.get_setting('flaresolverr_max_memory') or MAX_MEMORY_MB)
+        except ValueError:
+            self.max_memory_mb = MAX_MEMORY_MB
+
+        # FlareSolverr browser sessions (least recently used first) and Cloudflare clearances, keyed by domain
+        self.sessions = collections.OrderedDict()
+        self.clearances = {}
+        self.session_lock = threading.Lock()
+        self.http = requests.Session()
+        try:
+            self.max_sessions = max(1, int(kodi.get_setting('flaresolverr_max_sessions') or MAX_SESSIONS))
+        except ValueError:
+            self.max_sessions = MAX_SESSIONS
+
+        # Solve broker: concurrency limit, coalescing of identical urls and stats
+        try:
+            max_solves = int(kodi.get_setting('flaresolverr_max_solves') or MAX_CONCURRENT_SOLVES)
+        except ValueError:
+            max_solves = MAX_CONCURRENT_SOLVES
+        self.solve_slots = threading.BoundedSemaphore(max(1, max_solves))
+        self.solve_lock = threading.Lock()
+        self.pending_solves = {}
+        self.solve_stats = {'waiting': 0, 'active': 0, 'solves': 0, 'coalesced': 0, 'timeouts': 0,
+                            'latency_total': 0.0, 'latency_max': 0.0}
 
         # Path to store FlareSolverr files
         self.addon_path = addon.getAddonInfo('path')
@@ -201,28 +275,19 @@ class FlareSolverrService:
                 logger.log(f'Unsupported platform for FlareSolverr: {platform}', log_utils.LOGERROR)
                 return False
 
-            # Show a progress dialog
-            progress = xbmcgui.DialogProgress()
+            # Show a background progress dialog, the addon stays usable while this runs
+            progress = xbmcgui.DialogProgressBG()
             progress.create('Downloading FlareSolverr', 'Downloading required components...')
             progress.update(0)
 
-            # Download the file
+            # Download to a partial file, resuming it if a previous attempt was cut off
             logger.log(f'Downloading FlareSolverr from {download_url}', log_utils.LOGNOTICE)
-            response = requests.get(download_url, stream=True)
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-            bytes_downloaded = 0
+            part_file = self.flaresolverr_bin + '.part'
+            total_size = self._download_to(download_url, part_file, progress)
 
-            with open(self.flaresolverr_bin, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        bytes_downloaded += len(chunk)
-
-                        if total_size > 0:
-                            percent = min(100, int(bytes_downloaded * 100 / total_size))
-                            progress.update(percent)
+            # Only an intact download replaces the binary
+            self._verify_download(part_file, total_size)
+            os.replace(part_file, self.flaresolverr_bin)
 
             # Make the binary executable on Unix-like systems
             if not (platform == 'win32' or platform == 'win64'):
@@ -236,19 +301,151 @@ class FlareSolverrService:
             logger.log(f'Failed to download FlareSolverr: {str(e)}', log_utils.LOGERROR)
             if 'progress' in locals():
                 progress.close()
-            xbmcgui.Dialog().notification('Asguard', 
-                                       f'Failed to download FlareSolverr: {str(e)}', 
-                                       xbmcgui.NOTIFICATION_ERROR, 5000)
+            if not self.stop_event.is_set():
+                xbmcgui.Dialog().notification('Asguard', 
+                                           f'Failed to download FlareSolverr: {str(e)}', 
+                                           xbmcgui.NOTIFICATION_ERROR, 5000)
             return False
 
-    def start(self):
+    def _download_to(self, url, part_file, progress=None, attempts=DOWNLOAD_ATTEMPTS):
         """
-        Start the FlareSolverr service
+        Download url into part_file, using HTTP Range requests to continue
+        after a dropped connection. The ETag (or Last-Modified) of the download
+        is kept in part_file + '.meta' and sent as If-Range, so a partial file
+        of an older release is started over instead of being extended with a
+        newer one. Returns the expected total size (0 if unknown).
         """
-        if self.running:
+        meta_file = part_file + '.meta'
+        total_size = 0
+        for attempt in range(attempts):
+            offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+            validator = self._get_download_validator(meta_file) if offset else None
+            # without a validator there is no telling what the partial file holds
+            headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if validator else {}
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                    if response.status_code == 416:
+                        # nothing left to fetch, the partial file is already complete
+                        self._clear_download_validator(meta_file)
+                        return total_size or offset
+                    response.raise_for_status()
+                    if response.status_code == 206:
+                        content_range = response.headers.get('content-range', '')
+                        total_size = int(content_range.rsplit('/', 1)[-1]) if content_range.rsplit('/', 1)[-1].isdigit() else 0
+                        mode = 'ab'
+                    else:
+                        # no range asked for, or the file changed since the partial download: start over
+                        total_size = int(response.headers.get('content-length', 0))
+                        offset = 0
+                        mode = 'wb'
+                        self._set_download_validator(meta_file, response.headers)
+
+                    bytes_downloaded = offset
+                    with open(part_file, mode) as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            if self.stop_event.is_set():
+                                # the partial file and its validator are kept for the next start
+                                raise IOError('FlareSolverr download stopped')
+                            if chunk:
+                                f.write(chunk)
+                                bytes_downloaded += len(chunk)
+                                if progress is not None and total_size > 0:
+                                    progress.update(min(100, int(bytes_downloaded * 100 / total_size)))
+                if not total_size or bytes_downloaded >= total_size:
+                    self._clear_download_validator(meta_file)
+                    return total_size
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout) as e:
+                logger.log(f'FlareSolverr download interrupted (attempt {attempt + 1}): {str(e)}', log_utils.LOGWARNING)
+                if self.stop_event.wait(min(2 ** attempt, 10)):
+                    raise IOError('FlareSolverr download stopped')
+        raise IOError(f'FlareSolverr download incomplete after {attempts} attempts')
+
+    @staticmethod
+    def _get_download_validator(meta_file):
+        try:
+            with open(meta_file) as f:
+                return json.load(f).get('validator')
+        except (IOError, ValueError):
+            return None
+
+    @staticmethod
+    def _set_download_validator(meta_file, headers):
+        etag = headers.get('etag', '')
+        # If-Range only takes strong validators
+        validator = etag if etag and not etag.startswith('W/') else headers.get('last-modified')
+        try:
+            with open(meta_file, 'w') as f:
+                json.dump({'validator': validator}, f)
+        except IOError as e:
+            logger.log(f'Could not save the FlareSolverr download validator: {str(e)}', log_utils.LOGDEBUG)
+
+    @staticmethod
+    def _clear_download_validator(meta_file):
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+
+    def _verify_download(self, part_file, total_size):
+        """
+        Check the downloaded file's size and, when the flaresolverr_sha256
+        setting is filled in, its SHA-256
+        """
+        size = os.path.getsize(part_file)
+        if size == 0 or (total_size and size != total_size):
+            os.remove(part_file)
+            raise IOError(f'FlareSolverr download has {size} of {total_size} bytes')
+
+        expected_sha256 = (kodi.get_setting('flaresolverr_sha256') or '').strip().lower()
+        if expected_sha256:
+            sha256 = hashlib.sha256()
+            with open(part_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            if sha256.hexdigest() != expected_sha256:
+                os.remove(part_file)
+                raise IOError('FlareSolverr download failed checksum verification')
+
+    def start(self, wait=False, timeout=STARTUP_TIMEOUT):
+        """
+        Start the FlareSolverr service in the background.
+        Returns straight away unless wait is True; use wait_until_ready()
+        before sending a request that needs FlareSolverr.
+        """
+        if self.is_running():
             logger.log('FlareSolverr service is already running', log_utils.LOGDEBUG)
             return True
 
+        with self.start_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_event.clear()
+                self.ready_event.clear()
+                self.thread = threading.Thread(target=self._start, name='FlareSolverrStart')
+                self.thread.daemon = True
+                self.thread.start()
+
+        if wait:
+            return self.wait_until_ready(timeout)
+        return True
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Block until the background start has finished.
+        Returns True if FlareSolverr is ready to accept requests.
+        """
+        self.ready_event.wait(timeout)
+        return self.running
+
+    def _start(self):
+        try:
+            self.running = self._launch()
+        finally:
+            self.ready_event.set()
+        if self.running:
+            self._start_supervisor()
+
+    def _launch(self):
+        """
+        Download (if needed) and launch FlareSolverr, returning once it answers on /v1
+        """
         # Check if FlareSolverr binary exists, download if needed
         if not os.path.exists(self.flaresolverr_bin):
             if not self._download_flaresolverr():
@@ -267,7 +464,6 @@ class FlareSolverrService:
                 # Check if FlareSolverr is already running on this port
                 if self._test_connection():
                     logger.log('FlareSolverr is already running on the configured port', log_utils.LOGNOTICE)
-                    self.running = True
                     return True
                 else:
                     logger.log('Port is in use by another application', log_utils.LOGERROR)
@@ -276,6 +472,11 @@ class FlareSolverrService:
                                                xbmcgui.NOTIFICATION_ERROR, 5000)
                     return False
 
+        if self.stop_event.is_set():
+            # stop() was called while downloading, it found no process to stop
+            logger.log('FlareSolverr start cancelled', log_utils.LOGDEBUG)
+            return False
+
         # Start the FlareSolverr process
         try:
             logger.log(f'Starting FlareSolverr on port {self.port}', log_utils.LOGNOTICE)
@@ -283,41 +484,47 @@ class FlareSolverrService:
             # Prepare the command
             cmd = [self.flaresolverr_bin, '--port', str(self.port)]
 
-            # Start the process
+            # Start the process, its output is drained by reader threads so a
+            # full pipe buffer can never block it
+            self.output_tail.clear()
             self.process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 cwd=self.flaresolverr_path
             )
+            readers = [self._start_reader(self.process.stdout, 'stdout'),
+                       self._start_reader(self.process.stderr, 'stderr')]
+
+            # Poll the health endpoint until it answers or the process exits
+            if self._wait_for_ready():
+                logger.log(f'FlareSolverr started successfully on port {self.port}', log_utils.LOGNOTICE)
+                xbmcgui.Dialog().notification('Asguard', 
+                                           f'FlareSolverr started on port {self.port}', 
+                                           xbmcgui.NOTIFICATION_INFO, 3000)
+                return True
 
-            # Wait a moment for the process to start
-            time.sleep(2)
+            if self.stop_event.is_set() or self.process is None:
+                # stop() was called while starting, it may have run before Popen
+                self._terminate_process()
+                return False
 
-            # Check if the process started successfully
             if self.process.poll() is not None:
-                # Process has terminated
-                stderr = self.process.stderr.read().decode('utf-8')
+                # Process has terminated, let the readers collect its last output
+                for reader in readers:
+                    reader.join(2)
+                stderr = '\n'.join(self.output_tail)
                 logger.log(f'FlareSolverr process exited with error: {stderr}', log_utils.LOGERROR)
                 xbmcgui.Dialog().notification('Asguard', 
                                            f'FlareSolverr failed to start: {stderr}', 
                                            xbmcgui.NOTIFICATION_ERROR, 5000)
-                return False
-
-            # Test connection to FlareSolverr
-            if self._test_connection():
-                self.running = True
-                logger.log(f'FlareSolverr started successfully on port {self.port}', log_utils.LOGNOTICE)
-                xbmcgui.Dialog().notification('Asguard', 
-                                           f'FlareSolverr started on port {self.port}', 
-                                           xbmcgui.NOTIFICATION_INFO, 3000)
-                return True
             else:
                 logger.log('Failed to connect to FlareSolverr after starting', log_utils.LOGERROR)
+                self._terminate_process()
                 xbmcgui.Dialog().notification('Asguard', 
                                            'Failed to connect to FlareSolverr', 
                                            xbmcgui.NOTIFICATION_ERROR, 5000)
-                return False
+            return False
 
         except Exception as e:
             logger.log(f'Failed to start FlareSolverr: {str(e)}', log_utils.LOGERROR)
@@ -326,29 +533,31 @@ class FlareSolverrService:
                                        xbmcgui.NOTIFICATION_ERROR, 5000)
             return False
 
+    def _wait_for_ready(self, timeout=STARTUP_TIMEOUT, interval=READY_POLL_INTERVAL):
+        """
+        Poll the /v1 health endpoint until FlareSolverr reports ready
+        """
+        end_time = time.time() + timeout
+        while time.time() < end_time and not self.stop_event.is_set():
+            if self.process is not None and self.process.poll() is not None:
+                return False
+            if self._test_connection(timeout=interval * 4):
+                return True
+            time.sleep(interval)
+        return False
+
     def stop(self):
         """
         Stop the FlareSolverr service
         """
-        if not self.running:
+        self.stop_event.set()
+        if not self.running and self.process is None:
             logger.log('FlareSolverr service is not running', log_utils.LOGDEBUG)
             return True
 
         try:
-            if self.process:
-                # Try to terminate gracefully
-                self.process.terminate()
-
-                # Wait a moment for termination
-                try:
-                    self.process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    # Force kill if it doesn't terminate
-                    self.process.kill()
-                    self.process.wait()
-
-                self.process = None
-
+            self.destroy_sessions()
+            self._terminate_process()
             self.running = False
             logger.log('FlareSolverr stopped', log_utils.LOGNOTICE)
             return True
@@ -357,12 +566,162 @@ class FlareSolverrService:
             logger.log(f'Error stopping FlareSolverr: {str(e)}', log_utils.LOGERROR)
             return False
 
-    def _test_connection(self):
+    def _terminate_process(self):
+        if self.process:
+            # Try to terminate gracefully
+            self.process.terminate()
+
+            # Wait a moment for termination
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                # Force kill if it doesn't terminate
+                self.process.kill()
+                self.process.wait()
+
+            self.process = None
+
+    def _start_reader(self, pipe, name):
+        """
+        Read one of the process pipes until it closes, logging each line
+        and keeping the most recent ones for error reports
+        """
+        def read():
+            for line in iter(pipe.readline, b''):
+                line = line.decode('utf-8', 'replace').rstrip()
+                if line:
+                    self.output_tail.append(line)
+                    logger.log(f'FlareSolverr {name}: {line}', log_utils.LOGDEBUG)
+            pipe.close()
+
+        reader = threading.Thread(target=read, name=f'FlareSolverr-{name}')
+        reader.daemon = True
+        reader.start()
+        return reader
+
+    def _start_supervisor(self):
+        with self.start_lock:
+            if self.supervisor is None or not self.supervisor.is_alive():
+                self.supervisor = threading.Thread(target=self._supervise, name='FlareSolverrSupervisor')
+                self.supervisor.daemon = True
+                self.supervisor.start()
+
+    def _supervise(self, interval=HEALTH_CHECK_INTERVAL):
+        """
+        Probe /v1 and the process memory every interval seconds and restart
+        FlareSolverr when it has exited, stopped answering or grown too large
+        """
+        failures = 0
+        while not self.stop_event.wait(interval):
+            if self.thread is not None and self.thread.is_alive():
+                # a launch is in progress
+                continue
+            if not self.running and self.process is None:
+                continue
+            reason = None
+            self.health['checks'] += 1
+
+            if self.process is not None and self.process.poll() is not None:
+                reason = f'process exited with code {self.process.returncode}'
+            elif self._test_connection(timeout=10):
+                failures = 0
+            else:
+                failures += 1
+                self.health['failures'] += 1
+                if failures >= HEALTH_CHECK_FAILURES:
+                    reason = f'{failures} failed health checks'
+
+            memory_mb = self._get_memory_mb()
+            self.health['memory_mb'] = memory_mb
+            if reason is None and memory_mb is not None and self.max_memory_mb > 0 and memory_mb > self.max_memory_mb:
+                reason = f'memory use {memory_mb:.0f}MB over {self.max_memory_mb}MB'
+
+            if reason is not None and not self.stop_event.is_set():
+                failures = 0
+                self._restart_process(reason)
+
+    def _restart_process(self, reason):
+        logger.log(f'Restarting FlareSolverr: {reason}', log_utils.LOGWARNING)
+        self.health['restarts'] += 1
+        self.health['last_restart_reason'] = reason
+        self.running = False
+        # The browser sessions die with the process, clearances are plain cookies and stay valid
+        with self.session_lock:
+            self.sessions.clear()
+        try:
+            self._terminate_process()
+        except Exception as e:
+            logger.log(f'Error stopping FlareSolverr for restart: {str(e)}', log_utils.LOGERROR)
+            self.process = None
+        # Relaunch through start() so a request() arriving meanwhile waits on the same launch
+        self.start(wait=True)
+
+    def _get_memory_mb(self):
+        """
+        Resident memory of the FlareSolverr process and its children in MB,
+        or None when it can not be read on this platform
+        """
+        if self.process is None or self.process.poll() is not None:
+            return None
+        pid = self.process.pid
+        try:
+            if psutil is not None:
+                parent = psutil.Process(pid)
+                return sum(p.memory_info().rss for p in [parent] + parent.children(recursive=True)) / 1048576.0
+            if not os.path.exists(f'/proc/{pid}/status'):
+                return None
+            return sum(self._get_proc_rss(child) for child in self._get_proc_tree(pid)) / 1024.0
+        except Exception as e:
+            logger.log(f'FlareSolverr memory check failed: {str(e)}', log_utils.LOGDEBUG)
+            return None
+
+    @staticmethod
+    def _get_proc_rss(pid):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except (IOError, OSError, ValueError):
+            pass
+        return 0
+
+    @staticmethod
+    def _get_proc_tree(pid):
+        """
+        pid and all its descendants, found by the parent pid in /proc/<pid>/stat
+        so that processes started from any thread (Chromium is) are included
+        """
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # the command name may hold spaces and parentheses, the ppid follows the state after it
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (IOError, OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        pids = [pid]
+        for parent in pids:
+            pids.extend(children.get(parent, []))
+        return pids
+
+    def get_health(self):
+        """
+        Get the supervisor statistics: checks, failed probes, restarts and memory use
+        """
+        health = dict(self.health)
+        health['running'] = self.is_running()
+        return health
+
+    def _test_connection(self, timeout=5):
         """
         Test if FlareSolverr is responding
         """
         try:
-            response = requests.get(self.flare_solverr_api, timeout=5)
+            response = requests.get(self.flare_solverr_api, timeout=timeout)
             if response.status_code == 200:
                 data = response.json()
                 return data.get('status') == 'ready'
@@ -371,6 +730,244 @@ class FlareSolverrService:
 
         return False
 
+    def _api_call(self, payload, timeout=60):
+        response = requests.post(self.flare_solverr_api, json=payload, timeout=timeout)
+        return response.json()
+
+    @staticmethod
+    def _get_domain(url):
+        return urllib.parse.urlparse(url).hostname or ''
+
+    def get_session(self, domain):
+        """
+        Get the FlareSolverr browser session for a domain, creating it on first use.
+        Every session holds a Chromium instance, so sessions idle for
+        SESSION_IDLE_TTL are destroyed and at most max_sessions are kept open.
+        The lock only guards the bookkeeping, creating and destroying sessions
+        happens outside it so one slow browser does not hold up other domains.
+        """
+        while True:
+            with self.session_lock:
+                now = time.time()
+                # sessions still being created have no id yet and are left alone
+                others = [d for d, session in self.sessions.items() if d != domain and session['id'] is not None]
+                expired = [d for d in others if now - self.sessions[d]['used'] > SESSION_IDLE_TTL]
+                if domain not in self.sessions:
+                    in_use = [d for d in others if d not in expired]
+                    expired.extend(in_use[:max(0, len(self.sessions) - len(expired) - self.max_sessions + 1)])
+                evicted = [(d, self.sessions.pop(d)['id']) for d in expired]
+
+                session = self.sessions.get(domain)
+                creating = session is None
+                if creating:
+                    session = self.sessions[domain] = {'id': None, 'used': now, 'ready': threading.Event()}
+                elif session['id'] is not None:
+                    self.sessions.move_to_end(domain)
+                    session['used'] = now
+            for d, session_id in evicted:
+                self._destroy_session_id(d, session_id)
+            if creating:
+                break
+            if session['id'] is not None:
+                return session['id']
+            # another thread is creating it, look again once it is done as the create may fail
+            session['ready'].wait()
+
+        name = f'asguard_{domain}'
+        session_id = None
+        try:
+            data = self._api_call({'cmd': 'sessions.create', 'session': name})
+            if data.get('status') == 'ok':
+                session_id = data.get('session') or name
+            else:
+                logger.log(f'FlareSolverr session create failed for {domain}: {data.get("message")}', log_utils.LOGWARNING)
+        except Exception as e:
+            logger.log(f'FlareSolverr session create failed for {domain}: {str(e)}', log_utils.LOGWARNING)
+
+        with self.session_lock:
+            stale = self.sessions.get(domain) is not session
+            if not stale and session_id is None:
+                del self.sessions[domain]
+            elif not stale:
+                session['id'] = session_id
+                session['used'] = time.time()
+            session['ready'].set()
+        if stale and session_id is not None:
+            # destroyed or dropped by a restart while it was being created
+            self._destroy_session_id(domain, session_id)
+            return None
+        return session_id
+
+    def destroy_session(self, domain):
+        """
+        Destroy the FlareSolverr browser session for a domain
+        """
+        with self.session_lock:
+            session = self.sessions.pop(domain, None)
+        if session is not None and session['id'] is not None:
+            self._destroy_session_id(domain, session['id'])
+
+    def _destroy_session_id(self, domain, session_id):
+        try:
+            self._api_call({'cmd': 'sessions.destroy', 'session': session_id}, timeout=10)
+        except Exception as e:
+            logger.log(f'FlareSolverr session destroy failed for {domain}: {str(e)}', log_utils.LOGDEBUG)
+
+    def destroy_sessions(self):
+        for domain in list(self.sessions):
+            self.destroy_session(domain)
+
+    def get_clearance(self, url):
+        """
+        Get the cached Cloudflare clearance for a url's domain if it has not expired.
+        Returns a dict with 'cookies', 'user_agent' and 'expires', or None.
+        """
+        domain = self._get_domain(url)
+        clearance = self.clearances.get(domain)
+        if clearance and clearance['expires'] > time.time():
+            return clearance
+        self.clearances.pop(domain, None)
+        return None
+
+    def solve(self, url, max_timeout=60000, deadline=None):
+        """
+        Solve the Cloudflare challenge for a url through FlareSolverr.
+        At most max_solves requests run at once, callers asking for a url that
+        is already being solved share that result, and nobody waits past
+        deadline (a time.time() value, default now + max_timeout).
+        Returns the FlareSolverr solution dict or None.
+        """
+        if deadline is None:
+            deadline = time.time() + max_timeout / 1000.0
+        while True:
+            with self.solve_lock:
+                pending = self.pending_solves.get(url)
+                leader = pending is None
+                if leader:
+                    pending = {'event': threading.Event(), 'result': None, 'expired': False}
+                    self.pending_solves[url] = pending
+                else:
+                    self.solve_stats['coalesced'] += 1
+            if leader:
+                break
+            pending['event'].wait(max(0, deadline - time.time()))
+            # a leader that ran out of its own, earlier deadline says nothing about
+            # the url; try again, as the new leader if nobody else got there first
+            if pending['expired'] and pending['event'].is_set() and deadline > time.time():
+                continue
+            return pending['result']
+
+        try:
+            self._update_stats(waiting=1)
+            acquired = self.solve_slots.acquire(timeout=max(0, deadline - time.time()))
+            self._update_stats(waiting=-1)
+            if not acquired:
+                pending['expired'] = True
+                self._update_stats(timeouts=1)
+                logger.log(f'FlareSolverr queue deadline passed for {url}', log_utils.LOGWARNING)
+                return None
+            try:
+                self._update_stats(active=1)
+                start_time = time.time()
+                remaining = int((deadline - start_time) * 1000)
+                pending['result'] = self._solve(url, min(max_timeout, remaining)) if remaining > 0 else None
+                pending['expired'] = pending['result'] is None and remaining < max_timeout
+                latency = time.time() - start_time
+                with self.solve_lock:
+                    self.solve_stats['solves'] += 1
+                    self.solve_stats['latency_total'] += latency
+                    self.solve_stats['latency_max'] = max(self.solve_stats['latency_max'], latency)
+            finally:
+                self._update_stats(active=-1)
+                self.solve_slots.release()
+            return pending['result']
+        finally:
+            with self.solve_lock:
+                self.pending_solves.pop(url, None)
+            pending['event'].set()
+
+    def _update_stats(self, **changes):
+        with self.solve_lock:
+            for key, value in changes.items():
+                self.solve_stats[key] += value
+
+    def get_stats(self):
+        """
+        Get the solve broker statistics: queue depth, active solves, counts and latency
+        """
+        with self.solve_lock:
+            stats = dict(self.solve_stats)
+        stats['latency_avg'] = stats['latency_total'] / stats['solves'] if stats['solves'] else 0.0
+        return stats
+
+    def _solve(self, url, max_timeout):
+        """
+        Send one request.get to FlareSolverr through the domain's browser
+        session and cache the resulting clearance.
+        """
+        domain = self._get_domain(url)
+        payload = {'cmd': 'request.get', 'url': url, 'maxTimeout': max_timeout}
+        session_id = self.get_session(domain)
+        if session_id:
+            payload['session'] = session_id
+        try:
+            data = self._api_call(payload, timeout=max_timeout / 1000.0 + 5)
+        except Exception as e:
+            logger.log(f'FlareSolverr solve failed for {url}: {str(e)}', log_utils.LOGWARNING)
+            return None
+        if data.get('status') != 'ok':
+            logger.log(f'FlareSolverr could not solve {url}: {data.get("message")}', log_utils.LOGWARNING)
+            return None
+
+        solution = data.get('solution', {})
+        cookies = solution.get('cookies', [])
+        expires = time.time() + CLEARANCE_TTL
+        for cookie in cookies:
+            if cookie.get('name') == 'cf_clearance' and cookie.get('expires', -1) > 0:
+                expires = cookie['expires']
+        self.clearances[domain] = {'cookies': dict((c['name'], c['value']) for c in cookies),
+                                   'user_agent': solution.get('userAgent'),
+                                   'expires': expires}
+        return solution
+
+    @staticmethod
+    def _is_challenge(response):
+        if response.status_code not in (403, 429, 503):
+            return False
+        if not response.headers.get('Server', '').lower().startswith('cloudflare'):
+            return False
+        return 'cf-chl' in response.text or 'Just a moment' in response.text or 'cf_chl' in response.text
+
+    def request(self, url, headers=None, timeout=30):
+        """
+        Fetch a url with plain requests, using the cached Cloudflare clearance for
+        its domain. Falls back to a FlareSolverr solve only when there is no
+        clearance or Cloudflare rejects it. Returns the page html or ''.
+        """
+        headers = dict(headers or {})
+        clearance = self.get_clearance(url)
+        if clearance:
+            if clearance['user_agent']:
+                headers['User-Agent'] = clearance['user_agent']
+            try:
+                response = self.http.get(url, headers=headers, cookies=clearance['cookies'], timeout=timeout)
+                if not self._is_challenge(response):
+                    return response.text
+                logger.log(f'Cloudflare clearance rejected for {self._get_domain(url)}', log_utils.LOGDEBUG)
+                self.clearances.pop(self._get_domain(url), None)
+            except Exception as e:
+                logger.log(f'Request with cached clearance failed for {url}: {str(e)}', log_utils.LOGDEBUG)
+
+        deadline = time.time() + timeout
+        if not self.is_running():
+            self.start()
+        if not self.wait_until_ready(timeout):
+            return ''
+        solution = self.solve(url, max_timeout=int(timeout * 1000), deadline=deadline)
+        if solution:
+            return solution.get('response', '')
+        return ''
+
     def get_url(self):
         """
         Get the FlareSolverr URL
@@ -385,8 +982,10 @@ class FlareSolverrService:
 
     def is_running(self):
         """
-        Check if FlareSolverr is running
+        Check if FlareSolverr is running; a process that has exited is not
         """
+        if self.running and self.process is not None and self.process.poll() is not None:
+            self.running = False
         return self.running
 
     def restart(self):
@@ -395,7 +994,7 @@ class FlareSolverrService:
         """
         self.stop()
         time.sleep(1)
-        return self.start()
+        return self.start(wait=True)
 
 # Global instance
 _flaresolverr_service = None
@@ -23,20 +23,113 @@ import random
 import threading
 import os
 import json
+import time
+import shutil
+import collections
+import email.utils
 import urllib
 import kodi
 import log_utils
 from asguard_lib import image_scraper
 from asguard_lib import worker_pool
+from asguard_lib.constants import VIDEO_TYPES
+from asguard_lib.db_utils import DB_Connection
 from http.server import SimpleHTTPRequestHandler, HTTPServer
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
 logger = log_utils.Logger.get_logger(__name__)
 
+# In-memory image cache: max entries and seconds before an entry is looked up again
+PROXY_CACHE_SIZE = 2000
+PROXY_CACHE_TTL = 6 * 60 * 60
+# Scrapes run at once for /prefetch
+PREFETCH_WORKERS = 8
+
 class ValidationError(Exception):
     pass
 
+class ProxyCache(object):
+    """
+    LRU of scraped art dicts keyed by (video_type, trakt_id, season, episode),
+    bounded by entry count and age, with the image_cache table as a second tier
+    """
+    def __init__(self, max_size=PROXY_CACHE_SIZE, ttl=PROXY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = {'hits': 0, 'misses': 0, 'db_hits': 0, 'evictions': 0, 'expirations': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                images, expires = entry
+                if expires > time.time():
+                    self.cache.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return images
+                del self.cache[key]
+                self.counters['expirations'] += 1
+            self.counters['misses'] += 1
+
+        images = self.__get_db_images(key)
+        if images:
+            with self.lock:
+                self.counters['db_hits'] += 1
+            self.set(key, images)
+            return images
+        return None
+
+    def set(self, key, images):
+        with self.lock:
+            self.cache[key] = (images, time.time() + self.ttl)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def remove(self, key):
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def peek(self, key):
+        """
+        Memory-only lookup that leaves the counters and the LRU order alone
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+            return entry[0] if entry is not None and entry[1] > time.time() else None
+
+    def __contains__(self, key):
+        return self.peek(key) is not None
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.cache)
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        return stats
+
+    def __get_db_images(self, key):
+        video_type, trakt_id, season, episode = key
+        if video_type == image_scraper.OBJ_PERSON:
+            object_type = image_scraper.OBJ_PERSON
+        else:
+            object_type = VIDEO_TYPES.MOVIE if video_type == VIDEO_TYPES.MOVIE else VIDEO_TYPES.TVSHOW
+
+        # DB_Connection switches connections between threads, so every proxy worker gets its own
+        if getattr(self.local, 'db_connection', None) is None:
+            self.local.db_connection = DB_Connection()
+        try:
+            return self.local.db_connection.get_cached_images(object_type, trakt_id, season, episode)
+        except Exception as e:
+            logger.log('Image Proxy DB lookup failed for %s: %s' % (key, e), log_utils.LOGWARNING)
+            return None
+
 class ImageProxy(object):
     def __init__(self, host=None):
         self.host = '127.0.0.1' if host is None else host
@@ -73,6 +166,25 @@ class ImageProxy(object):
             self.svr_thread = None
             logger.log('Proxy thread reaped.', log_utils.LOGNOTICE)
 
+    def prefetch(self, video_type, video_ids, season='', episode=''):
+        """
+        Ask the proxy to scrape the art for a whole listing in the background.
+        video_ids is a list of ids dicts; an entry may carry its own 'season'
+        and 'episode'. Returns the number of items queued for scraping.
+        """
+        fields = {'video_type': video_type, 'video_ids': video_ids}
+        if season: fields['season'] = season
+        if episode: fields['episode'] = episode
+        # POSTed, a long listing would not fit in a query string
+        request = urllib.request.Request('http://%s:%s/prefetch' % (self.host, self.port), data=json.dumps(fields).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            res = json.loads(urllib.request.urlopen(request, timeout=10).read())
+        except Exception as e:
+            logger.log('Image Proxy prefetch failed: %s' % (e), log_utils.LOGWARNING)
+            return 0
+        return res.get('queued', 0)
+
     def __run(self):
         server_address = (self.host, self.port)
         logger.log('Attempting to start Image Proxy: %s:%s' % (server_address), log_utils.LOGNOTICE)
@@ -99,6 +211,7 @@ class ImageProxy(object):
 class MyHTTPServer(HTTPServer):
     def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True):
         self._wp = worker_pool.WorkerPool(max_workers=90)
+        self._prefetch_wp = worker_pool.WorkerPool(max_workers=PREFETCH_WORKERS)
         HTTPServer.__init__(self, server_address, RequestHandlerClass, bind_and_activate)
         
     def process_request(self, request, client_address):
@@ -115,7 +228,24 @@ class MyHTTPServer(HTTPServer):
             logging.debug(e)
             logger.log('Image Proxy Error: (%s) %s - %s' % (threading.current_thread().getName(), type(e), e), log_utils.LOGDEBUG)
     
+    def prefetch(self, key, fields):
+        self._prefetch_wp.request(func=self._prefetch, args=(key, fields))
+        # discard finished results so the out queue does not grow
+        while True:
+            try: self._prefetch_wp.receive(0)
+            except worker_pool.Empty: break
+
+    def _prefetch(self, key, fields):
+        try:
+            self.RequestHandlerClass.get_images(key, fields)
+        except Exception as e:
+            logger.log('Image Proxy prefetch failed for %s: %s' % (key, e), log_utils.LOGWARNING)
+
     def server_close(self):
+        try:
+            self._prefetch_wp.close()
+        except Exception:
+            pass
         try:
             workers = self._wp.close()
         except:
@@ -126,13 +256,16 @@ class MyHTTPServer(HTTPServer):
         HTTPServer.server_close(self)
         
 class MyRequestHandler(SimpleHTTPRequestHandler):
-    proxy_cache = {}
+    proxy_cache = ProxyCache(int(kodi.get_setting('proxy_cache_size') or PROXY_CACHE_SIZE),
+                             int(kodi.get_setting('proxy_cache_ttl') or PROXY_CACHE_TTL / 3600) * 3600)
     LOG_FILE = kodi.translate_path(os.path.join(kodi.get_profile(), 'proxy.log'))
     try: 
         log_fd = open(LOG_FILE, 'w')
     except: 
         log_fd = None
+    # guards pending: one scrape per cache key, other requests for that key wait on it
     lock = threading.Lock()
+    pending = {}
     ping_required = {}
 
     base_req = ['video_type', 'trakt_id', 'video_ids']
@@ -148,7 +281,10 @@ class MyRequestHandler(SimpleHTTPRequestHandler):
         'Episode': base_req + ['season', 'episode'],
         'person': base_req + ['name', 'person_ids']
     }
-    required = {'/ping': ping_required, '/': image_required, '/clear': clear_required}
+    stats_required = {}
+    prefetch_required = {'': ['video_type', 'video_ids']}
+    required = {'/ping': ping_required, '/': image_required, '/clear': clear_required, '/stats': stats_required,
+                '/prefetch': prefetch_required}
     
     def _set_headers(self, code=200):
         self.send_response(code)
@@ -159,6 +295,59 @@ class MyRequestHandler(SimpleHTTPRequestHandler):
         self.send_header('Location', url)
         self.end_headers()
         
+    def __send_file(self, path):
+        """
+        Serve a local image with length, type and validator headers, answering
+        conditional requests with 304. HEAD only stats the file.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404)
+            return
+
+        etag = '"%x-%x"' % (int(st.st_mtime), st.st_size)
+        last_modified = self.date_time_string(st.st_mtime)
+        if self.__not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(st.st_size))
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if self.command != 'GET':
+            return
+
+        with open(path, 'rb') as f:
+            self.wfile.flush()
+            try:
+                self.connection.sendfile(f)
+            except (AttributeError, ValueError, NotImplementedError):
+                # not a plain socket, copy it in chunks instead
+                f.seek(0)
+                shutil.copyfileobj(f, self.wfile)
+
+    def __not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError):
+                return False
+            return int(mtime) <= since
+        return False
+
     def log_message(self, format, *args):
         if self.log_fd is not None:
             self.log_fd.write('[%s] (%s) %s\n' % (self.log_date_time_string(), threading.current_thread().getName(), format % (args)))
@@ -167,7 +356,23 @@ class MyRequestHandler(SimpleHTTPRequestHandler):
         return self.do_GET()
         
     def do_POST(self):
-        self._set_headers(400)
+        """
+        /prefetch can also take its fields as a JSON body, with video_ids as a
+        list: a long listing does not fit in a request line. Nothing else is POSTed.
+        """
+        if self.path.split('?')[0] != '/prefetch':
+            self._set_headers(400)
+            return
+        try:
+            try:
+                fields = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            except ValueError as e:
+                raise ValidationError('Bad prefetch body: %s' % (e))
+            if not isinstance(fields, dict) or any(key not in fields for key in self.prefetch_required['']):
+                raise ValidationError('Missing Base Parameters: video_type, video_ids')
+            self.__send_json(self.__prefetch(fields))
+        except ValidationError as e:
+            self.__send_error(e)
     
     def do_GET(self):
         try:
@@ -176,42 +381,108 @@ class MyRequestHandler(SimpleHTTPRequestHandler):
                 self._set_headers()
                 self.wfile.write(b'OK')
                 return
+            elif action == '/stats':
+                self.__send_json(self.proxy_cache.stats())
+                return
+            elif action == '/prefetch':
+                self.__send_json(self.__prefetch(fields))
+                return
             else:
-                key = (fields['video_type'], fields['trakt_id'], fields.get('season'), fields.get('episode'))
+                key = (fields['video_type'], fields['trakt_id'], fields.get('season', ''), fields.get('episode', ''))
                 if action == '/clear':
-                    with self.lock:
-                        if key in self.proxy_cache:
-                            del self.proxy_cache[key]
-                        self._set_headers()
-                        self.wfile.write(b'OK')
-                        return
+                    self.proxy_cache.remove(key)
+                    self._set_headers()
+                    self.wfile.write(b'OK')
+                    return
                 else:
-                    with self.lock:
-                        if key in self.proxy_cache:
-                            images = self.proxy_cache[key]
-                        else:
-                            video_ids = json.loads(fields['video_ids'])
-                            if fields['video_type'] == image_scraper.OBJ_PERSON:
-                                person_ids = json.loads(fields['person_ids'])
-                                person = {'person': {'name': fields['name'], 'ids': person_ids}}
-                                images = image_scraper.scrape_person_images(video_ids, person)
-                            else:
-                                images = image_scraper.scrape_images(fields['video_type'], video_ids, fields.get('season', ''), fields.get('episode', ''))
-                            self.proxy_cache[key] = images
-                    
-                    image_url = images[fields['image_type']]
+                    images = self.get_images(key, fields)
+                    image_url = images[fields['image_type']] if images is not None else None
                     if image_url is None:
                         self._set_headers()
                     elif image_url.startswith('http'):
                         self.__redirect(image_url)
                     else:
-                        self._set_headers()
-                        if self.command == 'GET':
-                            with open(image_url, 'rb') as f:
-                                self.wfile.write(f.read())
+                        self.__send_file(image_url)
         except ValidationError as e:
             self.__send_error(e)
     
+    @classmethod
+    def get_images(cls, key, fields):
+        """
+        Get the art dict for a cache key, scraping it on a miss. Only one
+        thread scrapes a given key; concurrent requests for it share the result
+        """
+        images = cls.proxy_cache.get(key)
+        if images is not None:
+            return images
+
+        with cls.lock:
+            # a leader may have stored the art between the miss above and taking the lock
+            images = cls.proxy_cache.peek(key)
+            if images is not None:
+                return images
+            pending = cls.pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = {'event': threading.Event(), 'images': None}
+                cls.pending[key] = pending
+
+        if not leader:
+            pending['event'].wait()
+            return pending['images']
+
+        try:
+            pending['images'] = cls.__scrape(fields)
+            cls.proxy_cache.set(key, pending['images'])
+            return pending['images']
+        finally:
+            with cls.lock:
+                del cls.pending[key]
+            pending['event'].set()
+
+    def __prefetch(self, fields):
+        """
+        Queue a scrape on the server's prefetch pool for every listing item
+        that is not already in the memory cache
+        """
+        try:
+            items = fields['video_ids']
+            # JSON text from a query string, already decoded from a POST body
+            if isinstance(items, str): items = json.loads(items)
+            if isinstance(items, dict): items = [items]
+        except ValueError as e:
+            raise ValidationError('Bad video_ids for prefetch: %s' % (e))
+
+        if fields['video_type'] == image_scraper.OBJ_PERSON:
+            raise ValidationError('Person images can not be prefetched')
+
+        queued = cached = 0
+        for item in items:
+            video_ids = dict(item)
+            season = str(video_ids.pop('season', fields.get('season', '')))
+            episode = str(video_ids.pop('episode', fields.get('episode', '')))
+            if 'trakt' not in video_ids:
+                continue
+            key = (fields['video_type'], str(video_ids['trakt']), season, episode)
+            if key in self.proxy_cache:
+                cached += 1
+                continue
+            item_fields = {'video_type': fields['video_type'], 'trakt_id': key[1], 'video_ids': json.dumps(video_ids),
+                           'season': season, 'episode': episode}
+            self.server.prefetch(key, item_fields)
+            queued += 1
+        return {'queued': queued, 'cached': cached}
+
+    @staticmethod
+    def __scrape(fields):
+        video_ids = json.loads(fields['video_ids'])
+        if fields['video_type'] == image_scraper.OBJ_PERSON:
+            person_ids = json.loads(fields['person_ids'])
+            person = {'person': {'name': fields['name'], 'ids': person_ids}}
+            return image_scraper.scrape_person_images(video_ids, person)
+        else:
+            return image_scraper.scrape_images(fields['video_type'], video_ids, fields.get('season', ''), fields.get('episode', ''))
+
     def __validate(self, path):
         action = path.split('?')[0]
         params = self.parse_query(path)
@@ -241,6 +512,14 @@ class MyRequestHandler(SimpleHTTPRequestHandler):
     
     def __send_error(self, msg):
         self.send_error(400, str(msg))
+
+    def __send_json(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     @staticmethod
     def parse_query(path):
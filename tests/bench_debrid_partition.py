@@ -0,0 +1,76 @@
+"""
+Micro-benchmark for the local cache partitioning done at the start of
+DebridCheck.run(): reading debridcache.db, indexing the rows per debrid and
+splitting the requested hashes into cached / uncached / unchecked.
+
+Run from the repository root:
+
+    python tests/bench_debrid_partition.py
+
+For every size two thirds of the hashes are already in the local cache for
+each debrid (half cached, half uncached) and the rest are unchecked. The
+nested any() scan the partitioning used to do is timed alongside for the
+sizes where it finishes in reasonable time.
+"""
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import debridcheck  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+REPEATS = 5
+LEGACY_LIMIT = 1000
+
+
+def synthetic_hashes(count, seed):
+    return [hashlib.sha1(('%s-%d' % (seed, i)).encode('ascii')).hexdigest() for i in range(count)]
+
+
+def fill_cache(hash_list):
+    known = hash_list[:len(hash_list) * 2 // 3]
+    results = dict((debrid, [(h, 'True' if i % 2 else 'False') for i, h in enumerate(known)]) for debrid in ('rd', 'ad', 'pm'))
+    db_cache = debridcheck.DebridCache()
+    db_cache.check_database()
+    db_cache.clear_database()
+    db_cache.set_many_debrids(results)
+
+
+def time_partition(hash_list):
+    best = None
+    for _ in range(REPEATS):
+        checker = debridcheck.DebridCheck()
+        start = time.perf_counter()
+        checker._prepare(hash_list)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, checker
+
+
+def time_legacy_scan(hash_list, cached_hashes):
+    start = time.perf_counter()
+    for debrid in ('rd', 'ad', 'pm'):
+        [i for i in hash_list if not any([h for h in cached_hashes if str(h[0]) == i and str(h[1]) == debrid])]
+    return time.perf_counter() - start
+
+
+def main():
+    debridcheck.rd_enabled = debridcheck.ad_enabled = debridcheck.pm_enabled = True
+    print('%8s %14s %12s %16s' % ('hashes', 'partition ms', 'unchecked', 'legacy scan ms'))
+    for size in SIZES:
+        hash_list = synthetic_hashes(size, size)
+        fill_cache(hash_list)
+        elapsed, checker = time_partition(hash_list)
+        if size <= LEGACY_LIMIT:
+            legacy = '%.1f' % (time_legacy_scan(hash_list, checker.cached_hashes) * 1000)
+        else:
+            legacy = 'skipped'
+        print('%8d %14.2f %12d %16s' % (size, elapsed * 1000, len(checker.rd_hashes_unchecked), legacy))
+
+
+if __name__ == '__main__':
+    main()
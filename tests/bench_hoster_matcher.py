@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for HosterMatcher in alldebrid.py against the linear scan
+over every AllDebrid hoster regex that valid_url() used to do.
+
+Run from the repository root:
+
+    python tests/bench_hoster_matcher.py
+
+The hoster list imitates the user/hosts response: one regex per hoster,
+with optional subdomains, mirror alternations and a few patterns whose host
+can not be bucketed. The 500 urls mix supported and unsupported hosts, with
+and without a scheme. Both matchers must agree on every url.
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import alldebrid  # noqa: E402
+
+URLS = 500
+REPEATS = 5
+HOSTERS = ['1fichier.com', 'rapidgator.net', 'uploaded.net', 'nitroflare.com', 'katfile.com', 'ddownload.com',
+           'filefactory.com', 'mega.nz', 'mediafire.com', 'hitfile.net', 'turbobit.net', 'uptobox.com', 'dropapk.to',
+           'clicknupload.co', 'drop.download', 'filespace.com', 'hexupload.net', 'icerbox.com', 'isra.cloud',
+           'mixdrop.co', 'streamtape.com', 'upstream.to', 'vidoza.net', 'voe.sx', 'dailyuploads.net', 'userscloud.com',
+           'wupfile.com', 'fastbit.cc', 'filerio.in', 'file-up.org', 'gigapeta.com', 'google.com', 'hulkshare.com',
+           'k2s.cc', 'mexa.sh', 'prefiles.com', 'scribd.com', 'sendspace.com', 'soundcloud.com', 'tezfiles.com',
+           'uploadrar.com', 'vimeo.com', 'worldbytez.com', 'youtube.com', 'zippyshare.com', 'alfafile.net', 'ulozto.net',
+           'filestore.to', 'speed-down.org', 'usersdrive.com']
+OTHER_HOSTS = ['example.com', 'cdn.example.org', 'imdb.com', 'thetvdb.com', 'github.com', 'archive.org',
+               'files.example.net', 'media.example.co.uk']
+
+
+def hoster_patterns():
+    patterns = []
+    for i, host in enumerate(HOSTERS):
+        name, tld = host.rsplit('.', 1)
+        escaped = re.escape(name).replace('\\-', '-')
+        if i % 5 == 0:
+            patterns.append(r'https?://(?:[a-z0-9-]+\.)?%s\.%s/[a-z0-9]+' % (escaped, tld))
+        elif i % 5 == 1:
+            patterns.append(r'https?://(?:www\.)?(?:%s\.%s|%s\.(?:com|net))/(?:file/)?[a-z0-9]+' % (escaped, tld, escaped))
+        else:
+            patterns.append(r'(?:www\.)?%s\.%s/[a-z0-9_-]+' % (escaped, tld))
+    # patterns whose host part can not be bucketed by label
+    patterns += [r'(?:turbo)?bit\.net/f/[a-z0-9]+', r'(?:[a-z]+)?file\.org/[a-z0-9]+', r'https?://[^/]+/embed-[a-z0-9]+\.html',
+                 r'(?:ok|odnoklassniki)\.ru/video/\d+']
+    return patterns
+
+
+def synthetic_urls(count):
+    rng = random.Random(500)
+    hosts = HOSTERS + ['turbobit.net', 'bit.net', 'myfile.org', 'file.org', 'ok.ru'] + OTHER_HOSTS
+    urls = []
+    for i in range(count):
+        host = rng.choice(hosts)
+        if rng.random() < 0.2:
+            host = 'www.' + host
+        elif rng.random() < 0.1:
+            host = 'dl%d.%s' % (rng.randint(1, 9), host)
+        path = rng.choice(['f/abc%d' % i, 'file/%08x' % rng.getrandbits(32), 'embed-%d.html' % i, 'video/%d' % i, 'abc%d' % i])
+        scheme = rng.choice(['https://', 'http://', ''])
+        urls.append('%s%s/%s' % (scheme, host, path))
+    return urls
+
+
+def best_of(func):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    regexes = [re.compile(pattern) for pattern in hoster_patterns()]
+    urls = synthetic_urls(URLS)
+    matcher = alldebrid.HosterMatcher(regexes)
+    matcher_time, matched = best_of(lambda: [matcher.match(url) for url in urls])
+    linear_time, expected = best_of(lambda: [any(regexp.search(url) for regexp in regexes) for url in urls])
+    mismatches = [url for url, a, b in zip(urls, matched, expected) if a != b]
+    print('%d patterns (%d in fallback), %d urls, %d supported' % (len(regexes), len(matcher.fallback), len(urls), sum(expected)))
+    print('%-14s %10.2f ms' % ('linear scan', linear_time * 1000))
+    print('%-14s %10.2f ms' % ('HosterMatcher', matcher_time * 1000))
+    if mismatches:
+        print('%d urls matched differently, e.g. %s' % (len(mismatches), mismatches[0]))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""Minimal stand-in for asguard_lib.constants."""
+
+
+class VIDEO_TYPES:
+    MOVIE = 'Movie'
+    TVSHOW = 'TV Show'
+    SEASON = 'Season'
+    EPISODE = 'Episode'
@@ -0,0 +1 @@
+"""Minimal stand-in for asguard_lib.control."""
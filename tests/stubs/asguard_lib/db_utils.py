@@ -0,0 +1,6 @@
+"""Minimal stand-in for asguard_lib.db_utils: an empty image_cache table."""
+
+
+class DB_Connection(object):
+    def get_cached_images(self, object_type, trakt_id, season='', episode=''):
+        return {}
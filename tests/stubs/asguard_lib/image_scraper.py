@@ -0,0 +1,19 @@
+"""Minimal stand-in for asguard_lib.image_scraper: records scrapes and returns fixed art."""
+import threading
+import time
+
+OBJ_PERSON = 'person'
+SCRAPES = []
+DELAY = 0.0
+lock = threading.Lock()
+
+
+def scrape_images(video_type, video_ids, season='', episode=''):
+    time.sleep(DELAY)
+    with lock:
+        SCRAPES.append((video_type, video_ids.get('trakt'), season, episode))
+    return {'poster': 'http://images.example.com/%s/poster.jpg' % video_ids.get('trakt'), 'fanart': None}
+
+
+def scrape_person_images(video_ids, person):
+    return {'thumb': None}
@@ -0,0 +1,7 @@
+"""Minimal stand-in for asguard_lib.scraper_utils."""
+import base64
+import binascii
+
+
+def base32_to_hex(hash32, caller):
+    return binascii.hexlify(base64.b32decode(hash32)).decode('ascii')
@@ -0,0 +1,10 @@
+"""Minimal stand-in for asguard_lib.utils2."""
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def i18n(string_id):
+    return string_id
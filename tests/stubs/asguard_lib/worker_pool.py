@@ -0,0 +1,25 @@
+"""Minimal stand-in for asguard_lib.worker_pool on top of a thread pool."""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+Empty = queue.Empty
+
+
+class WorkerPool(object):
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.out_q = queue.Queue()
+
+    def request(self, func, args=None, kwargs=None):
+        self.executor.submit(lambda: self.out_q.put(func(*(args or ()), **(kwargs or {}))))
+
+    def receive(self, timeout):
+        return self.out_q.get(True, timeout) if timeout else self.out_q.get_nowait()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        return []
+
+
+def reap_workers(workers, timeout=0):
+    return []
@@ -0,0 +1 @@
+"""Minimal stand-in for Asguard's cache module."""
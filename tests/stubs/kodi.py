@@ -0,0 +1,37 @@
+"""Minimal stand-in for Asguard's kodi helper module."""
+import os
+import time
+
+SETTINGS = {}
+
+
+def get_setting(key, default=''):
+    return SETTINGS.get(key, default)
+
+
+def set_setting(key, value):
+    SETTINGS[key] = value
+
+
+def get_profile():
+    return os.environ.get('ASGUARD_TEST_PROFILE', '')
+
+
+def get_path():
+    return os.environ.get('ASGUARD_TEST_PROFILE', '')
+
+
+def get_version():
+    return '0.0.0'
+
+
+def translate_path(path):
+    return path
+
+
+def sleep(ms):
+    time.sleep(ms / 1000.0)
+
+
+def notify(*args, **kwargs):
+    pass
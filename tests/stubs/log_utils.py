@@ -0,0 +1,37 @@
+"""Minimal stand-in for Asguard's log_utils module; all logging is discarded."""
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+
+
+class Logger(object):
+    @staticmethod
+    def get_logger(name=None):
+        return Logger()
+
+    def log(self, msg, level=LOGDEBUG):
+        pass
+
+    def log_debug(self, msg):
+        pass
+
+    def log_warning(self, msg):
+        pass
+
+    def log_error(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def disable(self):
+        pass
+
+
+def log(msg, level=LOGDEBUG):
+    pass
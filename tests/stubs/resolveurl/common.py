@@ -0,0 +1,46 @@
+"""Minimal stand-in for resolveurl.common: settings, kodi helpers and a pass-through cache."""
+import os
+import time
+import log_utils
+
+addon_version = '0.0.0'
+profile_path = os.environ.get('ASGUARD_TEST_PROFILE', '')
+VIDEO_FORMATS = ['.mkv', '.mp4', '.avi']
+
+
+def i18n(string_id):
+    return string_id
+
+
+class kodi(object):
+    @staticmethod
+    def sleep(ms):
+        time.sleep(ms / 1000.0)
+
+    @staticmethod
+    def yesnoDialog(*args, **kwargs):
+        return False
+
+    class ProgressDialog(object):
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def update(self, *args, **kwargs):
+            pass
+
+        def is_canceled(self):
+            return False
+
+
+class cache(object):
+    @staticmethod
+    def cache_method(cache_limit=None):
+        def decorator(func):
+            return func
+        return decorator
@@ -0,0 +1,9 @@
+"""Minimal stand-in for resolveurl.lib.helpers."""
+
+
+def sort_sources_list(sources):
+    return sources
+
+
+def pick_source(sources):
+    return sources[0][1]
@@ -0,0 +1,35 @@
+"""Minimal stand-in for resolveurl.resolver: ResolveUrl with dict settings and a urllib Net."""
+import urllib.request
+
+SETTINGS = {}
+
+
+class ResolverError(Exception):
+    pass
+
+
+class Response(object):
+    def __init__(self, content):
+        self.content = content
+
+
+class Net(object):
+    def http_GET(self, url, headers=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        return Response(urllib.request.urlopen(request, timeout=30).read().decode('utf-8'))
+
+
+class ResolveUrl(object):
+    net = Net()
+
+    @classmethod
+    def get_setting(cls, key):
+        return SETTINGS.get('{0}_{1}'.format(cls.__name__, key), '')
+
+    @classmethod
+    def set_setting(cls, key, value):
+        SETTINGS['{0}_{1}'.format(cls.__name__, key)] = str(value)
+
+    @classmethod
+    def get_settings_xml(cls):
+        return []
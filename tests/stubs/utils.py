@@ -0,0 +1,10 @@
+"""Minimal stand-in for Asguard's utils module."""
+import json
+
+
+def json_loads_as_str(text):
+    return json.loads(text)
+
+
+def _byteify(data):
+    return data
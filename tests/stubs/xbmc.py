@@ -0,0 +1,25 @@
+"""Minimal stand-in for Kodi's xbmc module, enough to import the addon modules under test."""
+import time
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+
+
+def sleep(ms):
+    time.sleep(ms / 1000.0)
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=None):
+        if timeout:
+            time.sleep(timeout)
+        return False
+
+
+def log(msg, level=LOGDEBUG):
+    pass
@@ -0,0 +1,18 @@
+"""Minimal stand-in for Kodi's xbmcaddon module."""
+import os
+
+SETTINGS = {}
+
+
+class Addon(object):
+    def __init__(self, addon_id=None):
+        self.addon_id = addon_id
+
+    def getAddonInfo(self, key):
+        return os.environ.get('ASGUARD_TEST_PROFILE', '')
+
+    def getSetting(self, key):
+        return SETTINGS.get(key, '')
+
+    def setSetting(self, key, value):
+        SETTINGS[key] = value
@@ -0,0 +1,30 @@
+"""Minimal stand-in for Kodi's xbmcgui module. Dialog calls are counted in CALLS."""
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+CALLS = {'create': 0, 'update': 0, 'close': 0}
+
+
+class DialogProgressBG(object):
+    def create(self, *args, **kwargs):
+        CALLS['create'] += 1
+
+    def update(self, *args, **kwargs):
+        CALLS['update'] += 1
+
+    def close(self):
+        CALLS['close'] += 1
+
+
+class DialogProgress(DialogProgressBG):
+    def iscanceled(self):
+        return False
+
+
+class Dialog(object):
+    def notification(self, *args, **kwargs):
+        pass
+
+    def select(self, heading, items):
+        return 0
@@ -0,0 +1,14 @@
+"""Minimal stand-in for Kodi's xbmcvfs module. special:// paths map into the test profile."""
+import os
+
+
+def translatePath(path):
+    if path.startswith('special://'):
+        return os.path.join(os.environ.get('ASGUARD_TEST_PROFILE', ''), os.path.basename(path))
+    return path
+
+
+def mkdir(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return True
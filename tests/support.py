@@ -0,0 +1,22 @@
+"""
+Shared setup for the tests and benchmarks in this directory.
+
+The addon modules only import inside Kodi, so the minimal stand-ins in
+tests/stubs are put on sys.path, after the repository root (tests/ holds
+older copies of some modules that must not shadow the real ones).
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+STUBS_DIR = os.path.join(TESTS_DIR, 'stubs')
+
+os.environ.setdefault('ASGUARD_TEST_PROFILE', tempfile.mkdtemp(prefix='asguard-test-'))
+PROFILE_DIR = os.environ['ASGUARD_TEST_PROFILE']
+
+for path in (STUBS_DIR, ROOT_DIR):
+    if path in sys.path:
+        sys.path.remove(path)
+    sys.path.insert(0, path)
@@ -0,0 +1,289 @@
+"""
+AllDebridResolver against the Asguard debrid cache database and a local
+stand-in for the AllDebrid API.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import alldebrid  # noqa: E402
+import debridcheck  # noqa: E402
+import xbmcvfs  # noqa: E402
+from resolveurl import resolver  # noqa: E402
+
+
+class FakeAllDebridServer(ThreadingHTTPServer):
+    """
+    In-memory AllDebrid account: magnets are uploaded, become ready
+    `ready_after` seconds later (immediately for hashes in `instant`) and can
+    be listed, polled in live mode and deleted. Every request path is logged.
+    """
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        ThreadingHTTPServer.__init__(self, *args, **kwargs)
+        self.lock = threading.Lock()
+        self.paths = []
+        self.magnets = {}
+        self.instant = set()
+        self.ready_after = 1.0
+        self.links_after = 0.0
+        self.delete_delay = 0.0
+        self.next_id = 1
+
+    def add_magnet(self, _hash):
+        with self.lock:
+            transfer_id = self.next_id
+            self.next_id += 1
+            ready = _hash.lower() in self.instant
+            self.magnets[transfer_id] = {'hash': _hash.lower(), 'created': time.time() - (self.ready_after if ready else 0)}
+        return transfer_id
+
+    def magnet(self, transfer_id):
+        entry = self.magnets[transfer_id]
+        age = time.time() - entry['created']
+        magnet = {'id': transfer_id, 'hash': entry['hash'], 'magnet': entry['hash'], 'filename': 'Movie.2020.mkv', 'size': 2000000000}
+        if age < self.ready_after:
+            magnet.update({'status': 'Downloading', 'statusCode': 1, 'downloaded': int(2000000000 * age / self.ready_after),
+                           'downloadSpeed': 50000000, 'seeders': 10, 'links': []})
+        else:
+            links = []
+            if age >= self.ready_after + self.links_after:
+                links = [{'link': 'https://alldebrid.com/f/{0}'.format(transfer_id), 'filename': 'Movie.2020.mkv', 'size': 2000000000}]
+            magnet.update({'status': 'Ready', 'statusCode': 4, 'downloaded': 2000000000, 'downloadSpeed': 0, 'seeders': 0, 'links': links})
+        return magnet
+
+
+class FakeAllDebrid(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        server = self.server
+        with server.lock:
+            server.paths.append(parsed.path)
+        if parsed.path == '/v4/magnet/upload':
+            magnets = []
+            for _hash in query.get('magnets[]', []):
+                transfer_id = server.add_magnet(_hash)
+                magnet = server.magnet(transfer_id)
+                magnet['ready'] = magnet['statusCode'] == 4
+                magnets.append(magnet)
+            data = {'magnets': magnets}
+        elif parsed.path == '/v4/magnet/instant':
+            data = {'magnets': [{'magnet': h, 'hash': h, 'instant': h.lower() in server.instant} for h in query.get('magnets[]', [])]}
+        elif parsed.path == '/v4/magnet/delete':
+            time.sleep(server.delete_delay)
+            server.magnets.pop(int(query['id'][0]), None)
+            data = {'message': 'Magnet was successfully deleted'}
+        elif parsed.path == '/v4/magnet/status' and 'session' in query:
+            # live mode: a full listing for counter 0, only the changed fields afterwards
+            counter = int(query['counter'][0])
+            magnets = [server.magnet(transfer_id) for transfer_id in server.magnets]
+            if counter:
+                magnets = [dict((k, v) for k, v in magnet.items() if k in ('id', 'status', 'statusCode', 'downloaded', 'links')) for magnet in magnets]
+            data = {'magnets': magnets, 'counter': counter + 1, 'fullsync': not counter}
+        elif parsed.path == '/v4/magnet/status':
+            transfer_id = int(query['id'][0])
+            data = {'magnets': server.magnet(transfer_id) if transfer_id in server.magnets else []}
+        elif parsed.path == '/v4/link/unlock':
+            data = {'link': query['link'][0].replace('alldebrid.com/f/', 'stream.alldebrid.com/dl/')}
+        else:
+            data = None
+        body = json.dumps({'status': 'success', 'data': data} if data is not None else {'status': 'error', 'error': {'code': 'NOT_FOUND'}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeAllDebridServer(('127.0.0.1', 0), FakeAllDebrid)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.api_url = alldebrid.api_url
+        alldebrid.api_url = 'http://127.0.0.1:{0}/v4'.format(self.server.server_port)
+        resolver.SETTINGS['AllDebridResolver_token'] = 'token'
+        self.resolver = alldebrid.AllDebridResolver()
+
+    def tearDown(self):
+        alldebrid.api_url = self.api_url
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HosterMatcherTest(unittest.TestCase):
+    def test_labels_inside_a_word_are_not_bucketed(self):
+        matcher = alldebrid.HosterMatcher([r'(?:turbo)?bit\.net/f/', r'(?:[a-z]+)?file\.org/', r'https?://(?:www\.)?1fichier\.com/'])
+        self.assertEqual(len(matcher.fallback), 2)
+        self.assertTrue(matcher.match('https://turbobit.net/f/abc'))
+        self.assertTrue(matcher.match('https://myfile.org/abc'))
+        self.assertTrue(matcher.match('https://1fichier.com/?abc'))
+        self.assertFalse(matcher.match('https://example.com/f/abc'))
+
+    def test_tld_alternation_is_bucketed(self):
+        matcher = alldebrid.HosterMatcher([r'https?://(?:[a-z0-9-]+\.)?(?:uptobox\.com|uptobox\.(?:eu|net))/[a-z0-9]+'])
+        self.assertEqual(matcher.fallback, [])
+        self.assertTrue(matcher.match('https://www.uptobox.eu/abc'))
+
+    def test_url_without_scheme(self):
+        matcher = alldebrid.HosterMatcher([r'rapidgator\.net/file/'])
+        self.assertEqual(matcher.fallback, [])
+        self.assertTrue(matcher.match('rapidgator.net/file/abc'))
+        self.assertTrue(matcher.match('//rapidgator.net/file/abc'))
+
+
+class LocalCacheTest(unittest.TestCase):
+    def setUp(self):
+        db_cache = debridcheck.DebridCache()
+        db_cache.check_database()
+        db_cache.clear_database()
+        self.resolver = alldebrid.AllDebridResolver()
+
+    def _row(self, _hash):
+        dbcon = sqlite3.connect(xbmcvfs.translatePath(alldebrid.debrid_cache_db))
+        try:
+            return dbcon.execute("SELECT cached, expires, misses FROM debrid_data WHERE hash=? AND debrid='ad'", (_hash,)).fetchone()
+        finally:
+            dbcon.close()
+
+    def test_cached_result_uses_the_cached_ttl(self):
+        self.resolver._AllDebridResolver__set_local_cache({'a' * 40: True})
+        cached, expires, misses = self._row('a' * 40)
+        self.assertEqual((cached, misses), ('True', 0))
+        self.assertAlmostEqual(expires - time.time(), alldebrid.debrid_cache_ttl['cached'], delta=5)
+
+    def test_uncached_result_keeps_the_backoff(self):
+        debridcheck.DebridCache().set_many_debrids({'ad': [('b' * 40, 'False')]})
+        self.assertEqual(self._row('b' * 40)[2], 1)
+        self.resolver._AllDebridResolver__set_local_cache({'b' * 40: False})
+        cached, expires, misses = self._row('b' * 40)
+        self.assertEqual((cached, misses), ('False', 2))
+        self.assertAlmostEqual(expires - time.time(), 2 * alldebrid.debrid_cache_ttl['uncached'], delta=5)
+
+    def test_uncached_ttl_is_capped(self):
+        for _ in range(12):
+            self.resolver._AllDebridResolver__set_local_cache({'c' * 40: False})
+        cached, expires, misses = self._row('c' * 40)
+        self.assertEqual(misses, 12)
+        self.assertAlmostEqual(expires - time.time(), alldebrid.debrid_cache_max_uncached_ttl, delta=5)
+
+
+class TransferPollingTest(FakeApiTestCase):
+    def test_links_arrive_shortly_after_the_transfer_finishes(self):
+        transfer_id = self.server.add_magnet('d' * 40)
+        start = time.time()
+        transfer_info = self.resolver._AllDebridResolver__initiate_transfer(transfer_id)
+        elapsed = time.time() - start
+        self.assertEqual(transfer_info.get('statusCode'), 4)
+        self.assertTrue(transfer_info.get('links'))
+        # live-mode deltas are merged into the full listing
+        self.assertEqual(transfer_info.get('filename'), 'Movie.2020.mkv')
+        # ready after 1 s; the old fixed interval could not answer before 5 s
+        self.assertLess(elapsed, 2.5)
+        self.assertLessEqual(self.server.paths.count('/v4/magnet/status'), 6)
+
+    def test_links_are_waited_for_after_the_transfer_finishes(self):
+        self.server.ready_after = 0
+        self.server.links_after = 0.3
+        transfer_id = self.server.add_magnet('e' * 40)
+        transfer_info = self.resolver._AllDebridResolver__list_transfer(transfer_id)
+        self.assertEqual((transfer_info.get('statusCode'), transfer_info.get('links')), (4, []))
+        start = time.time()
+        transfer_info = self.resolver._AllDebridResolver__wait_for_links(transfer_id, transfer_info)
+        self.assertTrue(transfer_info.get('links'))
+        self.assertLess(time.time() - start, 1.5)
+
+
+class CachedOnlyTest(FakeApiTestCase):
+    def setUp(self):
+        FakeApiTestCase.setUp(self)
+        db_cache = debridcheck.DebridCache()
+        db_cache.check_database()
+        db_cache.clear_database()
+
+    def test_uncached_magnet_is_not_uploaded(self):
+        with self.assertRaises(resolver.ResolverError):
+            self.resolver.get_media_url('', 'magnet:?xt=urn:btih:' + 'f' * 40, cached_only=True, return_all=True)
+        self.assertEqual(self.server.paths, ['/v4/magnet/instant'])
+        self.assertFalse(self.server.magnets)
+
+    def test_cached_magnet_is_uploaded(self):
+        self.server.instant.add('1' * 40)
+        sources = self.resolver.get_media_url('', 'magnet:?xt=urn:btih:' + '1' * 40, cached_only=True, return_all=True)
+        self.assertEqual([source['name'] for source in sources], ['Movie.2020.mkv'])
+        self.assertEqual(self.server.paths[:2], ['/v4/magnet/instant', '/v4/magnet/upload'])
+
+    def test_known_uncached_magnet_skips_the_api(self):
+        debridcheck.DebridCache().set_many_debrids({'ad': [('2' * 40, 'False')]})
+        with self.assertRaises(resolver.ResolverError):
+            self.resolver.get_media_url('', 'magnet:?xt=urn:btih:' + '2' * 40, cached_only=True, return_all=True)
+        self.assertEqual(self.server.paths, [])
+
+    def test_upload_answers_readiness_without_cached_only(self):
+        self.server.instant.add('3' * 40)
+        self.resolver.get_media_url('', 'magnet:?xt=urn:btih:' + '3' * 40, return_all=True)
+        self.assertNotIn('/v4/magnet/instant', self.server.paths)
+
+
+class TransferRegistryTest(FakeApiTestCase):
+    def setUp(self):
+        FakeApiTestCase.setUp(self)
+        path = os.path.join(support.PROFILE_DIR, 'alldebrid_transfers_test.json')
+        if os.path.exists(path):
+            os.remove(path)
+        self.resolver.registry = alldebrid.TransferRegistry(path=path, max_entries=1)
+
+    def _play(self, _hash):
+        self.server.instant.add(_hash)
+        return self.resolver.get_media_url('', 'magnet:?xt=urn:btih:' + _hash)
+
+    def test_evicted_transfer_is_deleted_before_returning(self):
+        self.server.delete_delay = 0.3
+        self.assertTrue(self._play('4' * 40).startswith('https://stream.alldebrid.com/dl/'))
+        self.assertEqual(list(self.server.magnets), [1])
+        self._play('5' * 40)
+        self.assertEqual(list(self.server.magnets), [2])
+
+    def test_registered_transfer_is_reused(self):
+        self._play('6' * 40)
+        self._play('6' * 40)
+        self.assertEqual(self.server.paths.count('/v4/magnet/upload'), 1)
+        self.assertEqual(list(self.server.magnets), [1])
+
+    def test_unfinished_transfer_is_not_registered(self):
+        registered = self.resolver._AllDebridResolver__register_transfer('7' * 40, 1, {'statusCode': 4, 'links': []})
+        self.assertFalse(registered)
+        self.assertIsNone(self.resolver.registry.get('7' * 40))
+
+    def test_failed_save_keeps_the_previous_registry(self):
+        registry = self.resolver.registry
+        registry.put('8' * 40, 1, ['a.mkv'])
+
+        def partial_dump(transfers, f):
+            f.write('{"')
+            raise IOError('disk full')
+
+        with mock.patch.object(alldebrid.json, 'dump', partial_dump):
+            registry.put('9' * 40, 2, ['b.mkv'])
+        self.assertEqual(registry.get('8' * 40)['id'], 1)
+        self.assertFalse(os.path.exists('%s.%d.tmp' % (registry.path, os.getpid())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Connection reuse of the per-provider requests sessions in debridcheck.py,
+checked against a local stand-in for the AllDebrid API that counts the TCP
+connections it accepts.
+"""
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import debridcheck  # noqa: E402
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        ThreadingHTTPServer.__init__(self, *args, **kwargs)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.throttle = 0
+
+    def get_request(self):
+        request = ThreadingHTTPServer.get_request(self)
+        with self.lock:
+            self.connections += 1
+        return request
+
+
+class FakeAllDebrid(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            throttled = self.server.throttle > 0
+            if throttled:
+                self.server.throttle -= 1
+        if throttled:
+            body = json.dumps({'status': 'error', 'error': {'code': 'TOO_MANY_REQUESTS'}}).encode('utf-8')
+            self.send_response(429)
+        else:
+            body = json.dumps({'status': 'success', 'data': {'magnets': [{'hash': 'a' * 40, 'instant': True}]}}).encode('utf-8')
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DebridSessionTest(unittest.TestCase):
+    def setUp(self):
+        debridcheck._sessions.clear()
+        self.server = CountingServer(('127.0.0.1', 0), FakeAllDebrid)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:%d/v4/' % self.server.server_port
+
+    def tearDown(self):
+        for session in debridcheck._sessions.values():
+            session.close()
+        debridcheck._sessions.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _check(self):
+        api = debridcheck.ADapi()
+        api.base_url = self.base_url
+        api.token = 'token'
+        return api.check_cache(['a' * 40])
+
+    def test_sequential_chunks_share_one_connection(self):
+        for _ in range(20):
+            self.assertEqual(self._check(), [{'hash': 'a' * 40, 'instant': True}])
+        self.assertEqual(self.server.requests, 20)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_chunks_stay_within_the_pool(self):
+        def worker():
+            for _ in range(5):
+                self._check()
+
+        threads = [threading.Thread(target=worker) for _ in range(debridcheck.CHUNK_THREADS)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual(self.server.requests, 5 * debridcheck.CHUNK_THREADS)
+        self.assertLessEqual(self.server.connections, debridcheck.CHUNK_THREADS)
+
+    def test_throttled_request_is_retried(self):
+        self.server.throttle = 1
+        self.assertEqual(self._check(), [{'hash': 'a' * 40, 'instant': True}])
+        self.assertEqual(self.server.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
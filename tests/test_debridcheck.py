@@ -0,0 +1,104 @@
+"""
+DebridCheck result streaming and progress dialog, with the provider
+lookups replaced by in-process fakes.
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import debridcheck  # noqa: E402
+import xbmcgui  # noqa: E402
+
+
+class FakeADCheck(debridcheck.DebridCheck):
+    """DebridCheck whose AllDebrid lookup answers locally after a short delay."""
+    delay = 0.01
+
+    def _ad_lookup(self, hash_list):
+        time.sleep(self.delay)
+        for i, _hash in enumerate(hash_list):
+            cached = 'True' if i % 2 else 'False'
+            if cached == 'True':
+                self.ad_cached_hashes.append(_hash)
+            self.ad_process_results.append((_hash, cached))
+            self._publish('ad', _hash, cached)
+        return False
+
+
+class DebridCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.enabled = (debridcheck.rd_enabled, debridcheck.ad_enabled, debridcheck.pm_enabled)
+        debridcheck.rd_enabled, debridcheck.ad_enabled, debridcheck.pm_enabled = False, True, False
+        db_cache = debridcheck.DebridCache()
+        db_cache.check_database()
+        db_cache.clear_database()
+        self.hashes = [hashlib.sha1(str(i).encode('ascii')).hexdigest() for i in range(300)]
+
+    def tearDown(self):
+        debridcheck.rd_enabled, debridcheck.ad_enabled, debridcheck.pm_enabled = self.enabled
+
+    def test_results_are_cached_when_the_consumer_stops_early(self):
+        checker = FakeADCheck()
+        results = checker.iter_results(self.hashes)
+        self.assertEqual(next(results)[0], 'ad')
+        results.close()
+        checker.writer.join(10)
+        self.assertFalse(checker.writer.daemon)
+        rows = debridcheck.DebridCache().get_all(self.hashes)
+        self.assertEqual(len(rows), len(self.hashes))
+
+    def test_results_are_cached_after_a_full_iteration(self):
+        checker = FakeADCheck()
+        results = list(checker.iter_results(self.hashes))
+        self.assertEqual(len(results), len(self.hashes))
+        checker.writer.join(10)
+        self.assertEqual(len(debridcheck.DebridCache().get_all(self.hashes)), len(self.hashes))
+
+    def test_dialog_updates_once_per_provider(self):
+        hashes = [hashlib.sha1(('dialog-%d' % i).encode('ascii')).hexdigest() for i in range(5000)]
+        updates = xbmcgui.CALLS['update']
+        rd, ad, pm = FakeADCheck().run(hashes)
+        self.assertTrue(ad)
+        # the initial update only; the dialog closes when the one provider finishes
+        self.assertEqual(xbmcgui.CALLS['update'] - updates, 1)
+
+    def test_run_returns_once_the_providers_finish(self):
+        start = time.time()
+        rd, ad, pm = FakeADCheck().run(self.hashes)
+        self.assertTrue(ad)
+        # the dialog loop used to spin until DIALOG_TIMEOUT when the abort check raised
+        self.assertLess(time.time() - start, 5)
+
+
+class SweepTest(unittest.TestCase):
+    # each plugin call is a new interpreter, so every sweep runs in its own process
+    SCRIPT = ('import sys; sys.path.insert(0, %r); import support, debridcheck\n'
+              'cache = debridcheck.DebridCache()\n'
+              'print(cache.sweep_expired())\n'
+              'cache.sweeper and cache.sweeper.join()\n' % os.path.dirname(os.path.abspath(__file__)))
+
+    def setUp(self):
+        db_cache = debridcheck.DebridCache()
+        db_cache.check_database()
+        db_cache.clear_database()
+        with db_cache.connection.transaction() as dbcur:
+            dbcur.execute("DELETE FROM debrid_meta")
+            dbcur.execute("INSERT INTO debrid_data (hash, debrid, cached, expires) VALUES ('a', 'ad', 'False', 0)")
+
+    def _sweep(self):
+        return subprocess.check_output([sys.executable, '-c', self.SCRIPT]).decode('ascii').strip()
+
+    def test_sweep_is_throttled_across_plugin_calls(self):
+        self.assertEqual(self._sweep(), 'True')
+        self.assertEqual(debridcheck.DebridCache().connection.execute("SELECT * FROM debrid_data"), [])
+        self.assertEqual(self._sweep(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
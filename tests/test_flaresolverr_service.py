@@ -0,0 +1,376 @@
+"""
+FlareSolverrService against a local stand-in for the FlareSolverr /v1 API.
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import flaresolverr_service  # noqa: E402
+
+
+class FakeFlareSolverrServer(ThreadingHTTPServer):
+    """
+    Answers sessions.create / sessions.destroy and a request.get that takes
+    `solve_time` seconds, recording the commands and the peak concurrency.
+    `create_times` maps a session name to how long creating it takes.
+    """
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        ThreadingHTTPServer.__init__(self, *args, **kwargs)
+        self.lock = threading.Lock()
+        self.commands = []
+        self.sessions = set()
+        self.refuse_sessions = False
+        self.solve_time = 0.0
+        self.create_times = {}
+        self.active = 0
+        self.max_active = 0
+
+
+class FakeFlareSolverr(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        server = self.server
+        cmd = payload.get('cmd')
+        with server.lock:
+            server.commands.append((cmd, payload.get('url') or payload.get('session')))
+        if cmd == 'sessions.create':
+            time.sleep(server.create_times.get(payload['session'], 0))
+            if server.refuse_sessions:
+                data = {'status': 'error', 'message': 'Error: Unable to create session'}
+            else:
+                with server.lock:
+                    server.sessions.add(payload['session'])
+                data = {'status': 'ok', 'message': 'Session created successfully.', 'session': payload['session']}
+        elif cmd == 'sessions.destroy':
+            with server.lock:
+                server.sessions.discard(payload['session'])
+            data = {'status': 'ok', 'message': 'The session has been removed.'}
+        elif cmd == 'request.get':
+            with server.lock:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+            time.sleep(server.solve_time)
+            with server.lock:
+                server.active -= 1
+            data = {'status': 'ok', 'solution': {'url': payload['url'], 'status': 200, 'userAgent': 'Mozilla/5.0',
+                                                 'cookies': [{'name': 'cf_clearance', 'value': 'abc', 'expires': -1}]}}
+        else:
+            data = {'status': 'error', 'message': 'Unknown cmd'}
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFlareSolverrTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeFlareSolverrServer(('127.0.0.1', 0), FakeFlareSolverr)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.service = flaresolverr_service.FlareSolverrService()
+        self.service.flare_solverr_api = 'http://127.0.0.1:{0}/v1'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SessionPoolTest(FakeFlareSolverrTestCase):
+    def test_least_recently_used_session_is_destroyed(self):
+        self.service.max_sessions = 2
+        self.service.get_session('a.com')
+        self.service.get_session('b.com')
+        self.service.get_session('a.com')
+        self.service.get_session('c.com')
+        self.assertEqual(list(self.service.sessions), ['a.com', 'c.com'])
+        self.assertEqual(self.server.sessions, {'asguard_a.com', 'asguard_c.com'})
+
+    def test_idle_session_is_destroyed(self):
+        self.service.get_session('a.com')
+        self.service.sessions['a.com']['used'] -= flaresolverr_service.SESSION_IDLE_TTL + 1
+        self.service.get_session('b.com')
+        self.assertEqual(list(self.service.sessions), ['b.com'])
+        self.assertEqual(self.server.sessions, {'asguard_b.com'})
+
+    def test_failed_create_is_not_cached(self):
+        self.server.refuse_sessions = True
+        self.assertIsNone(self.service.get_session('a.com'))
+        self.assertEqual(self.service.sessions, {})
+        self.server.refuse_sessions = False
+        self.assertEqual(self.service.get_session('a.com'), 'asguard_a.com')
+
+    def _get_session_in_thread(self, domain):
+        thread = threading.Thread(target=self.service.get_session, args=(domain,))
+        thread.start()
+        return thread
+
+    def test_slow_create_does_not_block_other_domains(self):
+        self.server.create_times['asguard_slow.com'] = 1.0
+        thread = self._get_session_in_thread('slow.com')
+        time.sleep(0.1)
+        start = time.time()
+        self.assertEqual(self.service.get_session('fast.com'), 'asguard_fast.com')
+        self.assertLess(time.time() - start, 0.5)
+        thread.join(5)
+        self.assertEqual(set(self.service.sessions), {'slow.com', 'fast.com'})
+
+    def test_session_being_created_is_shared(self):
+        self.server.create_times['asguard_slow.com'] = 0.3
+        thread = self._get_session_in_thread('slow.com')
+        time.sleep(0.1)
+        self.assertEqual(self.service.get_session('slow.com'), 'asguard_slow.com')
+        thread.join(5)
+        self.assertEqual(self.server.commands, [('sessions.create', 'asguard_slow.com')])
+
+    def test_session_destroyed_while_created_is_not_kept(self):
+        self.server.create_times['asguard_a.com'] = 0.3
+        thread = self._get_session_in_thread('a.com')
+        time.sleep(0.1)
+        self.service.destroy_session('a.com')
+        thread.join(5)
+        self.assertEqual(self.service.sessions, {})
+        self.assertEqual(self.server.sessions, set())
+
+
+class SolveBrokerTest(FakeFlareSolverrTestCase):
+    def _solve_all(self, calls):
+        results = [None] * len(calls)
+
+        def worker(i, url, deadline):
+            results[i] = self.service.solve(url, max_timeout=5000, deadline=deadline)
+
+        threads = []
+        for i, (delay, url, deadline) in enumerate(calls):
+            time.sleep(delay)
+            threads.append(threading.Thread(target=worker, args=(i, url, deadline)))
+            threads[-1].start()
+        [t.join(10) for t in threads]
+        return results
+
+    def _solves(self):
+        return [arg for cmd, arg in self.server.commands if cmd == 'request.get']
+
+    def test_concurrency_is_limited(self):
+        self.service.solve_slots = threading.BoundedSemaphore(2)
+        self.server.solve_time = 0.2
+        results = self._solve_all([(0, 'https://site%d.com/' % i, None) for i in range(6)])
+        self.assertTrue(all(results))
+        self.assertEqual(self.server.max_active, 2)
+        self.assertEqual(self.service.get_stats()['solves'], 6)
+
+    def test_identical_urls_are_coalesced(self):
+        self.server.solve_time = 0.3
+        results = self._solve_all([(0, 'https://site.com/page', None)] * 5)
+        self.assertTrue(all(results))
+        self.assertEqual(self._solves(), ['https://site.com/page'])
+        self.assertEqual(self.service.get_stats()['coalesced'], 4)
+
+    def test_queued_solve_gives_up_at_its_deadline(self):
+        self.service.solve_slots = threading.BoundedSemaphore(1)
+        self.server.solve_time = 1.0
+        start = time.time()
+        results = self._solve_all([(0, 'https://slow.com/', None), (0.05, 'https://other.com/', time.time() + 0.3)])
+        self.assertTrue(results[0])
+        self.assertIsNone(results[1])
+        self.assertEqual(self.service.get_stats()['timeouts'], 1)
+        self.assertNotIn('https://other.com/', self._solves())
+        self.assertGreater(time.time() - start, 0.9)
+
+    def test_follower_outlives_an_expired_leader(self):
+        self.service.solve_slots = threading.BoundedSemaphore(1)
+        self.server.solve_time = 0.5
+        results = self._solve_all([(0, 'https://slow.com/', None),
+                                   (0.05, 'https://other.com/', time.time() + 0.2),
+                                   (0.05, 'https://other.com/', time.time() + 5)])
+        self.assertIsNone(results[1])
+        self.assertTrue(results[2])
+        self.assertEqual(self._solves(), ['https://slow.com/', 'https://other.com/'])
+
+
+class FakeReleaseServer(ThreadingHTTPServer):
+    """
+    Serves `payload` with an ETag, honouring Range and If-Range; the first
+    `drops` responses are cut off halfway by closing the socket. With a
+    `piece_delay` the body is sent in 256 KB pieces that far apart.
+    """
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        ThreadingHTTPServer.__init__(self, *args, **kwargs)
+        self.payload = b''
+        self.etag = '"v1"'
+        self.drops = 0
+        self.piece_delay = 0
+        self.requests = []
+
+
+class FakeRelease(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.headers.get('Range'), self.headers.get('If-Range')))
+        offset = 0
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range') in (None, server.etag):
+            offset = int(byte_range.split('=')[1].split('-')[0])
+        if offset >= len(server.payload) and byte_range:
+            self.send_response(416)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = server.payload[offset:]
+        self.send_response(206 if offset else 200)
+        if offset:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (offset, len(server.payload) - 1, len(server.payload)))
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.drops:
+            server.drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        if server.piece_delay:
+            try:
+                for i in range(0, len(body), 256 * 1024):
+                    self.wfile.write(body[i:i + 256 * 1024])
+                    self.wfile.flush()
+                    time.sleep(server.piece_delay)
+            except ConnectionError:
+                self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeReleaseServer(('127.0.0.1', 0), FakeRelease)
+        self.server.payload = os.urandom(3 * 1024 * 1024)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}/flaresolverr_linux_x64'.format(self.server.server_port)
+        self.part_file = os.path.join(support.PROFILE_DIR, 'flaresolverr_test.part')
+        for path in (self.part_file, self.part_file + '.meta'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.service = flaresolverr_service.FlareSolverrService()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _read_part(self):
+        with open(self.part_file, 'rb') as f:
+            return f.read()
+
+    def test_dropped_download_is_resumed(self):
+        self.server.drops = 1
+        total_size = self.service._download_to(self.url, self.part_file)
+        self.assertEqual(total_size, len(self.server.payload))
+        self.assertEqual(self._read_part(), self.server.payload)
+        self.assertEqual(len(self.server.requests), 2)
+        byte_range, if_range = self.server.requests[1]
+        self.assertNotEqual(byte_range, 'bytes=0-')
+        self.assertEqual(if_range, '"v1"')
+        self.assertFalse(os.path.exists(self.part_file + '.meta'))
+
+    def test_partial_file_of_another_release_is_started_over(self):
+        self.server.drops = 1
+        with self.assertRaises(IOError):
+            self.service._download_to(self.url, self.part_file, attempts=1)
+        self.server.payload = os.urandom(2 * 1024 * 1024)
+        self.server.etag = '"v2"'
+        self.service._download_to(self.url, self.part_file)
+        self.assertEqual(self._read_part(), self.server.payload)
+
+    def test_partial_file_without_validator_is_started_over(self):
+        with open(self.part_file, 'wb') as f:
+            f.write(b'x' * 1024)
+        self.service._download_to(self.url, self.part_file)
+        self.assertEqual(self.server.requests, [(None, None)])
+        self.assertEqual(self._read_part(), self.server.payload)
+
+    def test_stop_interrupts_the_download(self):
+        self.server.piece_delay = 0.1
+        threading.Timer(0.2, self.service.stop).start()
+        start = time.time()
+        with self.assertRaises(IOError):
+            self.service._download_to(self.url, self.part_file)
+        self.assertLess(time.time() - start, 1)
+        self.assertLess(len(self._read_part()), len(self.server.payload))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class StartTest(unittest.TestCase):
+    def test_stop_during_the_download_leaves_nothing_running(self):
+        service = flaresolverr_service.FlareSolverrService()
+        service.flaresolverr_bin = os.path.join(support.PROFILE_DIR, 'flaresolverr_missing')
+        downloading, stopped = threading.Event(), threading.Event()
+
+        def slow_download():
+            downloading.set()
+            stopped.wait(5)
+            return True
+
+        service._download_flaresolverr = slow_download
+        with mock.patch.object(flaresolverr_service.subprocess, 'Popen') as popen:
+            service.start()
+            self.assertTrue(downloading.wait(5))
+            self.assertTrue(service.stop())
+            stopped.set()
+            self.assertFalse(service.wait_until_ready(5))
+        self.assertFalse(popen.called)
+        self.assertIsNone(service.process)
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/stat'), 'needs /proc')
+class ProcessTreeTest(unittest.TestCase):
+    # starts a child from a second thread, the way Chromium's launcher does, and reports its pid
+    SCRIPT = (
+        'import subprocess, sys, threading, time\n'
+        'def spawn():\n'
+        '    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])\n'
+        '    print(child.pid, flush=True)\n'
+        '    child.wait()\n'
+        'threading.Thread(target=spawn).start()\n'
+    )
+
+    def test_children_of_every_thread_are_found(self):
+        process = subprocess.Popen([sys.executable, '-c', self.SCRIPT], stdout=subprocess.PIPE)
+        child = int(process.stdout.readline())
+        try:
+            self.assertIn(child, flaresolverr_service.FlareSolverrService._get_proc_tree(process.pid))
+        finally:
+            os.kill(child, signal.SIGTERM)
+            process.wait(10)
+            process.stdout.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
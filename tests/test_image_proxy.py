@@ -0,0 +1,105 @@
+"""
+Image proxy art lookups in socket_proxy.py and imgprox.py, with the image
+scraper and the image_cache table replaced by in-process fakes.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support  # noqa: E402,F401
+
+import imgprox  # noqa: E402
+import socket_proxy  # noqa: E402
+from asguard_lib import image_scraper  # noqa: E402
+
+KEY = ('Movie', '1', '', '')
+FIELDS = {'video_type': 'Movie', 'trakt_id': '1', 'video_ids': '{"trakt": 1}'}
+
+
+class ImageProxyTestMixin(object):
+    module = None
+
+    def setUp(self):
+        handler = self.module.MyRequestHandler
+        self.proxy_cache = handler.proxy_cache
+        handler.proxy_cache = self.module.ProxyCache()
+        del image_scraper.SCRAPES[:]
+
+    def tearDown(self):
+        self.module.MyRequestHandler.proxy_cache = self.proxy_cache
+        if getattr(self, 'httpd', None) is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def _start_server(self):
+        self.httpd = self.module.MyHTTPServer(('127.0.0.1', 0), self.module.MyRequestHandler)
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        proxy = self.module.ImageProxy()
+        proxy.port = self.httpd.server_port
+        return proxy
+
+    def _wait_for_scrapes(self, count, timeout=10):
+        deadline = time.time() + timeout
+        while len(image_scraper.SCRAPES) < count and time.time() < deadline:
+            time.sleep(0.05)
+        return len(image_scraper.SCRAPES)
+
+    def test_art_stored_while_taking_the_lock_is_not_scraped_again(self):
+        handler = self.module.MyRequestHandler
+        images = {'poster': 'http://images.example.com/1/poster.jpg'}
+        handler.proxy_cache.set(KEY, images)
+        # the miss that comes before the lock, as if another leader stored the art right after it
+        handler.proxy_cache.get = lambda key: None
+        self.assertIs(handler.get_images(KEY, FIELDS), images)
+        self.assertEqual(image_scraper.SCRAPES, [])
+
+    def test_peek_leaves_the_counters_alone(self):
+        cache = self.module.ProxyCache()
+        cache.set(KEY, {'poster': None})
+        self.assertEqual(cache.peek(KEY), {'poster': None})
+        self.assertIsNone(cache.peek(('Movie', '2', '', '')))
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (0, 0))
+
+    def test_long_listing_is_prefetched_through_a_post(self):
+        proxy = self._start_server()
+        video_ids = [{'trakt': i, 'imdb': 'tt%07d' % i, 'tmdb': i, 'slug': 'a-movie-title-%d' % i} for i in range(3000)]
+        # far beyond the 65536 byte request line limit as a query string
+        self.assertGreater(len(urllib.parse.quote(json.dumps(video_ids))), 65536)
+        self.assertEqual(proxy.prefetch('Movie', video_ids), 3000)
+        self.assertEqual(self._wait_for_scrapes(3000), 3000)
+
+    def test_query_string_prefetch_still_works(self):
+        proxy = self._start_server()
+        query = urllib.parse.urlencode({'video_type': 'Movie', 'video_ids': json.dumps([{'trakt': 1}, {'trakt': 2}])})
+        res = json.loads(urllib.request.urlopen('http://127.0.0.1:%d/prefetch?%s' % (proxy.port, query), timeout=10).read())
+        self.assertEqual(res, {'queued': 2, 'cached': 0})
+        self.assertEqual(self._wait_for_scrapes(2), 2)
+
+    def test_only_prefetch_is_posted(self):
+        proxy = self._start_server()
+        for path, body in (('/', b'{}'), ('/prefetch', b'not json'), ('/prefetch', b'{"video_type": "Movie"}')):
+            request = urllib.request.Request('http://127.0.0.1:%d%s' % (proxy.port, path), data=body)
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(request, timeout=10)
+            self.assertEqual(error.exception.code, 400)
+
+
+class SocketProxyTest(ImageProxyTestMixin, unittest.TestCase):
+    module = socket_proxy
+
+
+class ImgProxTest(ImageProxyTestMixin, unittest.TestCase):
+    module = imgprox
+
+
+if __name__ == '__main__':
+    unittest.main()